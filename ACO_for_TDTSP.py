@@ -1,330 +1,1421 @@
+import json
 import random
-from datetime import datetime, timedelta
-
-
-# define ant class
-class Ant:
-
-    attractions_to_visit = None
-    start_pos = None
-    start_datetime = None
-
-    def __init__(self, ant_key: tuple[str, str]):
-        assert ant_key in PARAM_ANT.keys()
-        self.stage = ant_key[0]
-        self.ant_type = ant_key[1]
-        self.params = PARAM_ANT[ant_key]
-        self.route = [] # 访问的游乐项目名称顺序
-        self.route_length = 0.0
-
-    def get_route_length(self, end_times: list = None, record_time=False):
-        current_datetime = Ant.start_datetime
-        current_pos = Ant.start_pos
-        T_total = 0
-        start_id = 0
-
-        if record_time:
-            self.record_time = []
-
-        if end_times is not None:
-            if len(end_times) == len(self.route):
-                return end_times[-1]
-            current_datetime = current_datetime + timedelta(minutes=end_times[-1])
-            current_pos = self.route[len(end_times) - 1]
-            T_total = end_times[-1]
-            start_id = len(end_times)
-
-        for i in range(start_id, len(self.route)):
-            tmp_destination = self.route[i]
-            # 到这个点的路途用时
-            T_travel = TRAVEL_TIME[No[current_pos]][No[tmp_destination]]
-            # 在这个项目排队用时
-            T_wait = predict_waiting_time(tmp_destination, current_datetime + timedelta(minutes=T_travel))
-            # 在这个项目游玩用时
-            T_enjoy = STAY_TIME[No[tmp_destination]]
-            T_delta = T_travel + T_wait + T_enjoy
-            T_total += T_delta
-            current_datetime = current_datetime + timedelta(minutes=T_delta)
-            current_pos = tmp_destination
-            if record_time:
-                self.record_time.append(current_datetime)
-
-        return T_total
-
-    def get_end_times(self):
-        current_datetime = Ant.start_datetime
-        current_pos = Ant.start_pos
-        T_total = 0
-
-        end_times = []
-
-        for i in range(len(self.route)):
-            tmp_destination = self.route[i]
-            T_travel = TRAVEL_TIME[No[current_pos]][No[tmp_destination]]
-            T_wait = predict_waiting_time(tmp_destination,
-                                          current_datetime + timedelta(
-                                              minutes=T_travel))
-            T_enjoy = STAY_TIME[No[tmp_destination]]
-            T_delta = T_travel + T_wait + T_enjoy
-            T_total += T_delta
-            end_times.append(T_total)
-            current_datetime = current_datetime + timedelta(minutes=T_delta)
-            current_pos = tmp_destination
-
-        return end_times
-
-    def construct_route(self, constructed_routes: list = None, F: dict = None, LF: dict = None):
-        assert self.ant_type != "elite"
-        self.route_length = 0.0
-        attractions_to_visit = Ant.attractions_to_visit[:]
-        if self.ant_type in ["stochastic", "deterministic"]:
-            current_datetime = Ant.start_datetime
-            current_pos = Ant.start_pos
-            t = 1
-            while len(attractions_to_visit) > 0:
-                weights = []
-                for attraction in attractions_to_visit:
-                    # 到这个点的路途用时
-                    T_travel = TRAVEL_TIME[No[current_pos]][No[attraction]]
-                    # 在这个项目排队用时
-                    T_wait = predict_waiting_time(attraction, current_datetime + timedelta(minutes=T_travel))
-                    # 在这个项目游玩用时
-                    T_enjoy = STAY_TIME[No[attraction]]
-                    T_delta = T_travel + T_wait + T_enjoy
-                    C = T_delta
-                    A = (F[current_pos, attraction, t]**self.params['alpha'] * C ** (-self.params['beta'])
-                         * LF[current_pos, attraction, t] ** self.params['gamma'])
-                    weights.append(A)
-                if self.ant_type == "stochastic":
-                    next_attraction = random.choices(attractions_to_visit, weights=weights, k=1)[0]
-                else:
-                    next_attraction = attractions_to_visit[weights.index(max(weights))]
-                attractions_to_visit.remove(next_attraction)
-                self.route.append(next_attraction)
-                T_travel = TRAVEL_TIME[No[current_pos]][No[next_attraction]]
-                T_wait = predict_waiting_time(next_attraction,
-                                              current_datetime + timedelta(minutes=T_travel))
-                T_enjoy = STAY_TIME[No[next_attraction]]
-                T_delta = T_travel + T_wait + T_enjoy
-                current_datetime = current_datetime + timedelta(minutes=T_delta)
-                current_pos = next_attraction
-                t += 1
-                self.route_length += T_delta
-        else:
-            iter = 0
-            while iter < 10:
-                random.shuffle(attractions_to_visit)
-                if attractions_to_visit not in constructed_routes:
-                    break
-                iter += 1
-            self.route = attractions_to_visit
-            self.route_length = self.get_route_length()
-
-
-# helper function
-def predict_waiting_time(attraction: str, start_datetime: datetime):
-    # use a simple way to predict: interpolate linearly
-    queue_time = WAIT_TIME[attraction]
-    open_time = queue_time[0][0]
-    close_time = queue_time[-1][0]
-    hour = start_datetime.hour
-    minute = start_datetime.minute
-
-    if hour < open_time or hour > close_time:
-        wait_time1 = 10000
-    else:
-        wait_time1 = queue_time[hour - open_time][1]
-
-    if hour + 1 < open_time or hour + 1 > close_time:
-        wait_time2 = 10000
-    else:
-        wait_time2 = queue_time[hour + 1 - open_time][1]
-
-    predicted_wait_time = wait_time1 + minute / 60 * (wait_time2 - wait_time1)
-    return predicted_wait_time
-
-
-def local_search(best_ant: Ant):
-    best_ant.route = best_ant.route[:]  # 防止与其它的route之间存在引用关系
-    initial_route = best_ant.route[:]
-    end_times = best_ant.get_end_times()
-    best_route = initial_route
-    min_route_len = best_ant.route_length
-    for s in range(1, len(initial_route)):
-        best_ant.route[s - 1] = initial_route[s]
-        best_ant.route[s] = initial_route[s - 1]
-        if s >= 2:
-            best_ant.get_route_length(end_times[:s - 1])
-        else:
-            best_ant.get_route_length()
-        # update best solution if it's obtained
-        if best_ant.route_length < min_route_len:
-            min_route_len = best_ant.route_length
-            best_route = best_ant.route
-        best_ant.route = initial_route[:]
-    best_ant.route = best_route
-    best_ant.route_length = min_route_len
-    return best_ant
-
-
-def plan_route(attractions_to_visit: list,
-               start_time: str = "9:30", current_pos: str = "Fantasia Carousel"):
-    for attraction in attractions_to_visit:
-        assert attraction in ATTRACTIONS
-    start_time = ''.join(start_time.split())
-    start_time = datetime.strptime(start_time, '%H:%M').time()
-    today = datetime.now().date()
-    start_datetime = datetime.combine(today, start_time)
-
-    Ant.attractions_to_visit = attractions_to_visit
-    Ant.start_datetime = start_datetime
-    Ant.start_pos = current_pos
-
-    attractions = attractions_to_visit + [current_pos]
-    T = [i + 1 for i in range(len(attractions) - 1)]
-    F = dict()
-    LF = dict()
-    for i in attractions:
-        for j in attractions:
-            for t in T:
-                F[i, j, t] = 1
-                LF[i, j, t] = 1
-
-    stagn_start_iter = -1
-    best_route = None
-    min_route_len = 1e8
-
-    for l in range(PARAM_PROGRAM["maxTime"]):
-        if l < PARAM_PROGRAM["initTime"]:
-            stage = "init"
-        elif l > PARAM_PROGRAM["maxTime"] - PARAM_PROGRAM["finishTime"]:
-            stage = "final"
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime, time, timedelta
+from time import perf_counter
+from typing import Callable
+
+from utils.CompiledPark import CompiledPark
+from utils.ThemePark import ThemePark
+from utils.WaitModel import LiveOverride, WaitModel
+
+
+# ---------------- default parameters ----------------
+PARAM_PROGRAM = {"maxTime": 100, "finishTime": 10, "initTime": 10,
+                 "stagnCounter": 10, "improvePath": True,
+                 "neighborhoods": ("swap", "2opt", "oropt"),  # 局部搜索使用的邻域
+                 "pheromoneDtype": np.float64,  # np.float32 可减半信息素内存
+                 "workers": 1,  # >1 时用进程池并行构造蚂蚁
+                 "cacheSize": 10000,  # 每次请求缓存的路线时长 / 局部搜索结果条数上限
+                 # 信息素更新方式："all" 所有蚂蚁都释放信息素；"mmas" 为 Max-Min Ant System：
+                 # 只有本次迭代最好的蚂蚁（每 mmasGlobalEvery 次迭代换成全局最好的）释放，F 限制在 [τmin, τmax]，
+                 # 进入 stagnate 阶段时信息素重置为 τmax。mmasPbest 决定 τmin
+                 "pheromoneUpdate": "all", "mmasGlobalEvery": 5, "mmasPbest": 0.05,
+                 # 实时排队时间（见 Planner.replan）与历史数据的差值在多少分钟内线性衰减到 0
+                 "liveWaitDecay": 60,
+                 "exactMax": 15,  # 要访问的项目不超过这个数时用动态规划求精确解（solve_exact），0 表示总是用 ACO
+                 # 提前结束的条件，None 表示不启用：墙钟时间预算（秒）、连续多少次迭代没有改进、
+                 # 信息素熵（见 Pheromone.entropy）低于多少
+                 "timeBudget": None, "patience": None, "minEntropy": None}
+RHO = {"init": 0.9, "main": 0.9, "stagnate": 0.3, "final": 0.5}
+PARAM_ANT = {("init", "random"): {"count": 100},
+             ("stagnate", "random"): {"count": 100},
+             ("main", "stochastic"): {"alpha": 0.8, "beta": 0.7, "gamma": 0.9, "count": 200, "LR": 10},
+             ("main", "deterministic"): {"alpha": 0.8, "beta": 0.8, "gamma": 0.5, "count": 50, "LR": 5},
+             ("final", "stochastic"): {"alpha": 0.2, "beta": 0.2, "gamma": 0.5, "count": 150, "LR": 3},
+             ("final", "stochastic"): {"alpha": 0.5, "beta": 0.1, "gamma": 0.1, "count": 100, "LR": 5}}
+M = 1
+# 每个项目游玩的时间，这里做了简单化处理，认为都是10分钟
+STAY_TIME = 10
+
+
+@dataclass
+class FixedEvent:
+    """
+    固定时间的活动（演出、午餐、快速通行证的预约时段等），作为路线中的一个节点：
+    在 location（项目名称，用于计算步行时间）从 start 开始，持续 duration 分钟。
+    latest 不为 None 时可以在 [start, latest] 内任意时刻开始（例如午餐）；早到的等到 start。
+    时刻可以是 "H:MM"、datetime 或距开园的分钟数。
+    """
+    name: str
+    location: str
+    start: "str | datetime | float"
+    duration: float
+    latest: "str | datetime | float" = None
+
+
+@dataclass
+class RouteRequest:
+    attractions_to_visit: list[str]
+    start_time: str = "9:30"
+    current_pos: str = "Fantasia Carousel"
+    # 时间约束，见 PlanState
+    windows: dict = None
+    events: list[FixedEvent] = None
+
+
+@dataclass
+class PlanResult:
+    route: list[str]
+    total_time: float
+    # 求解统计：迭代次数、构造的蚂蚁数、代价函数 (单段路程耗时) 的计算次数
+    iterations: int = 0
+    ants: int = 0
+    evaluations: int = 0
+    # 结束原因: maxTime / timeBudget / patience / minEntropy，动态规划求出的精确解为 exact
+    stop_reason: str = "maxTime"
+    # 路线时长 / 局部搜索缓存的命中与未命中次数
+    cache_hits: int = 0
+    cache_misses: int = 0
+    warm_start: bool = False  # 是否用 PheromoneStore 中相似请求的结果热启动
+    # 路线上每个项目玩完的时刻（datetime），与 route 一一对应
+    schedule: list[datetime] = field(default_factory=list)
+    # 重新规划（Planner.replan）需要的状态：出发位置、规划的日期、出发时刻（距开园的分钟数）和最终的信息素
+    start_pos: str = None
+    start_minute: float = 0.0
+    day: date = None
+    pheromone: "Pheromone" = field(default=None, repr=False)
+    # 请求的时间约束（见 PlanState），重新规划时沿用
+    windows: dict = field(default=None, repr=False)
+    events: list = field(default=None, repr=False)
+
+
+class Colony:
+    """
+    一组蚂蚁的紧凑表示：routes[a, t] 为第 a 只蚂蚁的编码路线（attractions_to_visit 的下标），
+    lengths[a] 为路线时长，kinds[a] 为蚂蚁种类在 ant_keys 中的下标。数组按 capacity 只蚂蚁预先分配，
+    可以在迭代之间 reset 后重复使用，只有前 size 只有效；项目名称只在得到最终结果时才解码。
+    另外记录构造 / 局部搜索的统计和耗时。
+    """
+    __slots__ = ("routes", "lengths", "kinds", "ant_keys", "size", "evaluations", "cache_hits", "cache_misses",
+                 "construction_time", "local_search_time")
+
+    def __init__(self, capacity: int, n: int, ant_keys: list[tuple[str, str]]):
+        self.routes = np.empty((capacity, n), dtype=np.intp)
+        self.lengths = np.empty(capacity)
+        self.kinds = np.empty(capacity, dtype=np.intp)
+        self.ant_keys = ant_keys
+        self.reset()
+
+    def reset(self):
+        self.size = 0
+        self.evaluations = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.construction_time = 0.0
+        self.local_search_time = 0.0
+
+    def add(self, kind: int, count: int) -> slice:
+        # 为 count 只 kind 种类的蚂蚁占位，返回它们在数组中的位置
+        block = slice(self.size, self.size + count)
+        self.kinds[block] = kind
+        self.size += count
+        return block
+
+    def extend(self, other: "Colony"):
+        # 合并另一组蚂蚁（例如 worker 的结果）及其统计
+        block = self.add(0, other.size)
+        self.routes[block] = other.routes[:other.size]
+        self.lengths[block] = other.lengths[:other.size]
+        self.kinds[block] = other.kinds[:other.size]
+        for name in ("evaluations", "cache_hits", "cache_misses", "construction_time", "local_search_time"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def best(self) -> int:
+        return int(np.argmin(self.lengths[:self.size]))
+
+    def __getstate__(self):
+        # 只传有效的部分
+        return {name: getattr(self, name)[:self.size] if name in ("routes", "lengths", "kinds")
+                else getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+@dataclass
+class IterationEvent:
+    """
+    每次迭代结束后传给 callback 的信息。phase_times 的单位为秒：
+    colony 为构造 + 局部搜索的总墙钟时间（并行时包括分发和合并），construction / local_search 为各蚂蚁组
+    自己计时的和（并行时是各 worker 的时间之和），pheromone 为信息素蒸发和更新。
+    排队时间的预测是构造和局部搜索中的查表操作，计入这两个阶段。
+    """
+    iteration: int
+    stage: str
+    best_length: float
+    iteration_best: float
+    improved: bool
+    wall_time: float
+    phase_times: dict[str, float]
+    ants: int
+    evaluations: int
+    stagnation_start: int  # 开始停滞的迭代，-1 表示没有停滞
+    stagnation_count: int  # 已经停滞的迭代数
+    best_route: list[str] = None  # 目前最好的路线（项目名称）
+
+
+class ConvergenceTrace:
+    """收集每次迭代的 IterationEvent，可直接作为 solve 的 callback，并导出为 JSON。"""
+
+    def __init__(self):
+        self.events: list[IterationEvent] = []
+
+    def __call__(self, event: IterationEvent):
+        self.events.append(event)
+
+    def as_dicts(self) -> list[dict]:
+        return [asdict(event) for event in self.events]
+
+    def phase_totals(self) -> dict[str, float]:
+        totals = {}
+        for event in self.events:
+            for phase, seconds in event.phase_times.items():
+                totals[phase] = totals.get(phase, 0.0) + seconds
+        return totals
+
+    def to_json(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.as_dicts(), f, ensure_ascii=False, indent=2)
+
+
+class RouteCache:
+    """有容量上限的 LRU 缓存，键为编码路线的元组，统计命中 / 未命中次数。"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        if key not in self._data:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+
+class PlanState:
+    """一次规划请求的状态：要访问的项目、起点、出发时间，以及它们在乐园中的编号。"""
+
+    def __init__(self, planner: "Planner", attractions_to_visit: list[str], start_time: "str | datetime | float",
+                 current_pos: str, seed: int, wait_overrides: dict[str, float] = None,
+                 windows: dict[str, tuple] = None, events: list[FixedEvent] = None, day: date = None):
+        """
+        start_time 可以是 "H:MM" 字符串、datetime，或距开园的分钟数；不是 datetime 时日期取 day（默认为今天）。
+        规划器带 WaitModel 时按这一天的日历 profile 选择排队时间表。
+        wait_overrides 为 {项目: 现在的实时排队时间}，见 Planner.live_wait_table。
+        windows 为 {项目: (最早, 最晚)}：只能在这段时间内到达开始排队，早到的等到最早时刻；
+        events 为固定时间的活动（FixedEvent），作为额外的节点加在 attractions_to_visit 后面。
+        """
+        events = events or []
+        for attraction in (attractions_to_visit + [current_pos] + list(wait_overrides or {}) + list(windows or {})
+                           + [event.location for event in events]):
+            if attraction not in planner.No:
+                raise ValueError(f"Unknown attraction: {attraction}")
+        for event in events:
+            if event.name in planner.No or event.name in attractions_to_visit:
+                raise ValueError(f"Event name clashes with an attraction: {event.name}")
+        if isinstance(start_time, datetime):
+            today = start_time.date()
         else:
-            if stagn_start_iter >= 0 and l - stagn_start_iter >= PARAM_PROGRAM["stagnCounter"]:
-                stage = "stagnate"
+            today = day or datetime.now().date()
+        # 求解过程中的时间都是距开园的分钟数（浮点数），只在输入 / 输出时与 datetime 互相转换
+        self.open_datetime = datetime.combine(today, time(planner.open_time))
+        self.start_minute = self.to_minute(start_time)
+        if self.start_minute < 0:
+            raise ValueError(f"start_time must not be earlier than park opening ({planner.open_time}:00)")
+        self.start_datetime = self.to_datetime(self.start_minute)
+
+        self.attractions_to_visit = attractions_to_visit + [event.name for event in events]
+        self.windows = windows or {}
+        self.events = events
+        self.start_pos = current_pos
+        # 活动的编号接在乐园的项目后面，对应 travel_array / stay_array / wait_array 中追加的行
+        self.ride_ids = np.array([planner.No[a] for a in attractions_to_visit]
+                                 + list(range(len(planner.attractions), len(planner.attractions) + len(events))),
+                                 dtype=np.intp)
+        self.node_ids = np.append(self.ride_ids, planner.No[current_pos])
+        self.local_id = {attraction: k for k, attraction in enumerate(attractions_to_visit)}
+        self.seed = seed
+        self.evaluations = 0
+        # 编码路线 -> 总时长；编码路线 -> 从它出发的局部搜索结果
+        self.length_cache = RouteCache(planner.param_program["cacheSize"])
+        self.search_cache = RouteCache(planner.param_program["cacheSize"])
+        self.candidates = {}  # k -> 候选列表，见 Planner.candidate_lists
+        # 本次请求使用的排队时间表：规划器带 WaitModel 时为这一天的表，有实时排队时间或活动时再修正；
+        # 都没有时为 None，用 Planner.wait_array。有活动时步行 / 游玩时间表也是本次请求专用的
+        self.wait_day = today if planner.wait_model is not None else None
+        self.own_table = bool(wait_overrides or events)
+        self.wait_array = planner.day_table(self.wait_day) if self.wait_day is not None else None
+        if wait_overrides:
+            self.wait_array = planner.live_wait_table(wait_overrides, self.start_minute, self.wait_array)
+        self.travel_array = None
+        self.stay_array = None
+        # 各项目 / 活动最早开始排队的时刻（距开园的分钟数），早到的等到这个时刻；没有时间约束时为 None
+        self.release_array = None
+        self.deadline_array = None  # 各项目 / 活动最晚开始排队的时刻，晚到的路线不可行
+        # 各节点（attractions_to_visit 的下标）最晚的到达时刻，没有时间约束的为 inf；
+        # 构造路线时用来提前排除会错过某个时间窗口的选择，见 Planner.construct_routes
+        self.deadlines = None
+        if windows or events:
+            self._apply_constraints(planner, windows or {}, events)
+
+    def to_datetime(self, minute: float) -> datetime:
+        return self.open_datetime + timedelta(minutes=minute)
+
+    def to_minute(self, value: "str | datetime | float") -> float:
+        # to_datetime 的逆变换："H:MM"、datetime 或距开园的分钟数
+        if isinstance(value, str):
+            value = datetime.combine(self.open_datetime.date(), datetime.strptime(''.join(value.split()), '%H:%M').time())
+        if isinstance(value, datetime):
+            return (value.hour - self.open_datetime.hour) * 60 + value.minute
+        return float(value)
+
+    def _apply_constraints(self, planner: "Planner", windows: dict[str, tuple], events: list[FixedEvent]):
+        # 时间窗口 [最早, 最晚] 按连续的到达时刻计算：早到的等到最早时刻（release_array），
+        # 晚于最晚时刻到达的路线不可行（deadline_array）
+        size = len(planner.attractions) + len(events)
+        release = np.zeros(size)
+        deadline = np.full(size, np.inf)
+        for ride, (earliest, latest) in windows.items():
+            release[planner.No[ride]] = self.to_minute(earliest)
+            deadline[planner.No[ride]] = self.to_minute(latest)
+        if events:
+            # 活动：排队时间为 0（只有等到开始的时间），在所在项目的位置上
+            for k, event in enumerate(events, start=len(planner.attractions)):
+                release[k] = self.to_minute(event.start)
+                deadline[k] = self.to_minute(event.latest) if event.latest is not None else release[k]
+            rows = np.zeros((len(events), planner.profile_end + 1))
+            rows[:, -1] = np.inf
+            self.wait_array = np.vstack([planner.wait_table(self), rows])
+            index = np.append(np.arange(len(planner.attractions)), [planner.No[event.location] for event in events])
+            self.travel_array = planner.travel_array[np.ix_(index, index)]
+            self.stay_array = np.append(planner.stay_array, [event.duration for event in events])
+        self.release_array = release
+        self.deadline_array = deadline
+        self.deadlines = deadline[self.ride_ids]
+
+    @property
+    def cache_hits(self):
+        return self.length_cache.hits + self.search_cache.hits
+
+    @property
+    def cache_misses(self):
+        return self.length_cache.misses + self.search_cache.misses
+
+    def __getstate__(self):
+        # 发给 worker 时不带缓存内容，worker 用同样容量的空缓存
+        state = self.__dict__.copy()
+        state["length_cache"] = RouteCache(self.length_cache.maxsize)
+        state["search_cache"] = RouteCache(self.search_cache.maxsize)
+        if not self.own_table:
+            # 日历 profile 的排队时间表 worker 自己有（见 _run_colony_task），不用每次都发
+            state["wait_array"] = None
+        return state
+
+
+class Pheromone:
+    """
+    信息素 F / LF 存放在连续的浮点数组里，下标为 [t, i, j]：
+    t 为路线中的位置（0 起），i 为出发节点（attractions_to_visit 的下标，n 表示起点），
+    j 为目标项目（attractions_to_visit 的下标）。
+    每个数组占 n * (n + 1) * n 个元素，可以用 dtype=np.float32 减半内存。
+    """
+
+    def __init__(self, n: int, dtype=np.float64, node_ids: np.ndarray = None):
+        self.n = n
+        self.F = np.ones((n, n + 1, n), dtype=dtype)
+        self.LF = np.ones((n, n + 1, n), dtype=dtype)
+        self.node_ids = node_ids  # 各节点在乐园中的 ride id（最后一个为起点），用于 project
+        self._positions = np.arange(n)
+
+    def project(self, node_ids: np.ndarray, shift: int = 0) -> "Pheromone":
+        """
+        把信息素投影到另一组节点上（例如重新规划时剩下的项目和当前位置），位置整体后移 shift
+        （已经玩过的项目数）。原来没有的边取同一行中已有边的平均值，整行都没有时为 1。
+        """
+        n = len(node_ids) - 1
+        position = {node: k for k, node in enumerate(self.node_ids.tolist())}
+        rows = np.array([position.get(node, -1) for node in node_ids.tolist()])
+        cols = np.where(rows[:-1] < self.n, rows[:-1], -1)  # 原来的起点不能作为目标
+        known = np.broadcast_to((rows[:, None] >= 0) & (cols[None, :] >= 0), (n, n + 1, n))
+        t = np.minimum(np.arange(n) + shift, self.n - 1)
+        index = np.ix_(t, np.maximum(rows, 0), np.maximum(cols, 0))
+
+        projected = Pheromone(n, self.F.dtype, node_ids)
+        for name in ("F", "LF"):
+            values = np.where(known, getattr(self, name)[index], 0.0)
+            count = known.sum(axis=2, keepdims=True)
+            mean = np.divide(values.sum(axis=2, keepdims=True), count, out=np.ones(count.shape), where=count > 0)
+            getattr(projected, name)[...] = np.where(known, values, mean)
+        return projected
+
+    @property
+    def nbytes(self):
+        return self.F.nbytes + self.LF.nbytes
+
+    def reset(self, value: float):
+        self.F.fill(value)
+        self.LF.fill(value)
+
+    def clamp(self, low: float, high: float):
+        np.clip(self.F, low, high, out=self.F)
+
+    def evaporate(self, rho: float, local: bool = True):
+        self.F *= rho
+        if local:
+            self.LF *= rho
+
+    def _edges(self, routes: np.ndarray):
+        # 每条路线的 (t, i, j) 边，第一步从起点 n 出发
+        prev = np.empty_like(routes)
+        prev[:, 0] = self.n
+        prev[:, 1:] = routes[:, :-1]
+        t = np.broadcast_to(self._positions[:routes.shape[1]], routes.shape)
+        return t, prev, routes
+
+    def deposit(self, routes: np.ndarray, amount: np.ndarray):
+        # routes: (ants, n) 的整数路线，amount: 每只蚂蚁在每条边上增加的信息素
+        np.add.at(self.F, self._edges(routes), amount[:, None])
+
+    def deposit_local(self, routes: np.ndarray, amount: np.ndarray, LR: np.ndarray):
+        # 局部信息素只加在每条路线的前 LR 步上，第 j 步权重为 (LR - j) / (LR^2 + LR)，第 0 步为 1 / (LR + 1)
+        j = self._positions[:routes.shape[1]]
+        LR = LR[:, None]
+        factor = np.where(j == 0, 1 / (LR + 1), (LR - j) / (LR ** 2 + LR))
+        factor = np.where(j < LR, factor, 0.0)
+        np.add.at(self.LF, self._edges(routes), amount[:, None] * factor)
+
+    def entropy(self) -> float:
+        # 每行 F[t, i, :] 归一化后的熵（除以 log n，取值 0~1），按各行的信息素总量加权平均；
+        # 没走过的边只会蒸发，权重越来越小。越接近 0 说明蚂蚁的选择越集中，搜索基本收敛
+        if self.n < 2:
+            return 0.0
+        mass = self.F.sum(axis=2, dtype=np.float64)
+        p = self.F / mass[..., None]
+        h = -np.sum(p * np.log(np.where(p > 0, p, 1.0)), axis=2) / np.log(self.n)
+        return float(np.sum(h * mass) / mass.sum())
+
+
+def mmas_bounds(best_length: float, n: int, m: float = M, pbest: float = 0.05):
+    """
+    MMAS 的信息素上下界。本文件中每次释放的量为 (1 - rho) / (m * L)，稳定后的信息素为 1 / (m * L)，
+    所以 τmax = 1 / (m * L_best)；τmin 按构造出最好路线的概率为 pbest 来估算（Stützle & Hoos 2000）。
+    """
+    tau_max = 1 / (m * best_length)
+    root = pbest ** (1 / n)
+    tau_min = tau_max * (1 - root) / (max(n / 2 - 1, 1) * root)
+    return min(tau_min, tau_max), tau_max
+
+
+def neighbors(route: list, neighborhoods) -> tuple[list, int, int]:
+    """
+    依次生成 route 的邻域解 (candidate, i, j)，candidate 只在位置 i..j 上与 route 不同。
+    swap: 交换相邻两个项目；2opt: 反转一段；oropt: 把长度 1~3 的一段挪到别的位置。
+    """
+    n = len(route)
+    if "swap" in neighborhoods:
+        for s in range(1, n):
+            candidate = route[:]
+            candidate[s - 1], candidate[s] = route[s], route[s - 1]
+            yield candidate, s - 1, s
+    if "2opt" in neighborhoods:
+        for i in range(n - 2):
+            for j in range(i + 2, n):
+                yield route[:i] + route[i:j + 1][::-1] + route[j + 1:], i, j
+    if "oropt" in neighborhoods:
+        for length in range(1, 4):
+            for i in range(n - length + 1):
+                segment = route[i:i + length]
+                rest = route[:i] + route[i + length:]
+                for p in range(len(rest) + 1):
+                    # p == i 是原路线；length 为 1 且 p == i + 1 与 swap 重复
+                    if p == i or (length == 1 and p == i + 1 and "swap" in neighborhoods):
+                        continue
+                    yield rest[:p] + segment + rest[p:], min(i, p), max(i, p) + length - 1
+
+
+@dataclass
+class StoredSolution:
+    # PheromoneStore 中的一条记录，节点编号均为乐园中的 ride id
+    start_minute: float
+    node_ids: np.ndarray  # 要访问的项目 + 起点
+    preference: np.ndarray  # (n + 1, n)：从 node_ids[i] 到 node_ids[j] 的信息素（对位置求和后按行归一化）
+    route: list[int]
+    total_time: float
+
+
+class PheromoneStore:
+    """
+    一个乐园的热启动存储：按出发时间窗口（window 分钟）记录已求解请求学到的信息素和最好路线，最多 max_entries 条。
+    新请求从出发时间相邻窗口内、项目集合（含起点）重合度最高且不低于 min_overlap 的记录热启动：
+    信息素按项目投影到新请求上，F = (1 - weight) + weight * n * preference，未出现过的边为 1；
+    记录的最好路线去掉不需要的项目、用最便宜插入补上新项目后，作为初始的全局最好路线（elite 蚂蚁沿它走）。
+    存储只在当前进程内有效，进程池中的 worker 各自有一份。
+    """
+
+    def __init__(self, window: int = 30, max_entries: int = 1000, min_overlap: float = 0.5, weight: float = 0.5):
+        self.window = window
+        self.max_entries = max_entries
+        self.min_overlap = min_overlap
+        self.weight = weight
+        self.entries = OrderedDict()  # (窗口, 节点集合, 起点) -> StoredSolution
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _bucket(self, state: PlanState):
+        return int(state.start_minute // self.window)
+
+    def record(self, state: PlanState, pheromone: Pheromone, route: list[int], total_time: float):
+        # route 为编码路线
+        F = pheromone.F.sum(axis=0, dtype=np.float64)
+        key = (self._bucket(state), frozenset(state.node_ids.tolist()), int(state.node_ids[-1]))
+        self.entries[key] = StoredSolution(state.start_minute, state.node_ids.copy(), F / F.sum(axis=1, keepdims=True),
+                                           state.ride_ids[route].tolist(), total_time)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def lookup(self, state: PlanState) -> StoredSolution | None:
+        bucket = self._bucket(state)
+        nodes = set(state.node_ids.tolist())
+        best, best_score = None, self.min_overlap
+        for (entry_bucket, entry_nodes, _), entry in self.entries.items():
+            if abs(entry_bucket - bucket) > 1:
+                continue
+            overlap = len(nodes & entry_nodes) / len(nodes | entry_nodes)
+            # 重合度相同时取出发时间更近的
+            score = overlap - abs(entry.start_minute - state.start_minute) / (1e3 * self.window)
+            if score >= best_score:
+                best, best_score = entry, score
+        if best is not None:
+            self.entries.move_to_end((int(best.start_minute // self.window), frozenset(best.node_ids.tolist()),
+                                      int(best.node_ids[-1])))
+        return best
+
+    def seed(self, planner: "Planner", state: PlanState, pheromone: Pheromone, entry: StoredSolution):
+        """把记录投影到当前请求上：初始化信息素 F，返回补全后的编码路线及其时长"""
+        n = len(state.ride_ids)
+        m = len(entry.node_ids) - 1
+        position = {node: k for k, node in enumerate(entry.node_ids.tolist())}
+        # 当前请求的各节点在记录中的行号（出发节点）和列号（目标项目，记录的起点不能作为目标），没有为 -1
+        rows = np.array([position.get(node, -1) for node in state.node_ids.tolist()])
+        cols = np.where(rows[:-1] < m, rows[:-1], -1)
+        known = (rows[:, None] >= 0) & (cols[None, :] >= 0)
+        preference = np.where(known, entry.preference[np.maximum(rows, 0)[:, None], np.maximum(cols, 0)[None, :]], 0.0)
+        # 只在有记录的边上重新归一化，没有记录的边保持初始值 1
+        total = preference.sum(axis=1, keepdims=True)
+        preference = np.divide(preference, total, out=np.zeros_like(preference), where=total > 0)
+        F = np.where(known, (1 - self.weight) + self.weight * known.sum(axis=1, keepdims=True) * preference, 1.0)
+        pheromone.F[...] = F[None, :, :]
+
+        # 记录的路线中本次要访问的项目按原顺序保留，其余项目逐个插到使总时长最短的位置
+        route = [state.local_id[planner.attractions[ride]] for ride in entry.route
+                 if planner.attractions[ride] in state.local_id]
+        for k in sorted(set(range(n)) - set(route)):
+            options = [route[:p] + [k] + route[p:] for p in range(len(route) + 1)]
+            lengths = planner.evaluate_routes(state, options)
+            route = options[int(np.argmin(lengths))]
+        return route, float(planner.evaluate_routes(state, [route])[0])
+
+
+class Planner:
+    """
+    针对一个 ThemePark 的路线规划器。构造时一次性编译好排队时间表、步行时间矩阵等数据，
+    之后可以反复调用 plan_route / plan_many 处理不同游客的请求。
+    workers > 1 时持有一个进程池：plan_route 在池中并行构造蚂蚁，plan_many 把请求分发到各个进程。
+    """
+
+    def __init__(self, park: ThemePark | CompiledPark, param_program: dict = None, rho: dict = None, param_ant: dict = None,
+                 m: float = M, stay_time: float | list[float] = STAY_TIME, pheromone_store: PheromoneStore = None,
+                 wait_model: WaitModel = None):
+        self.park = park
+        # 不为 None 时按请求日期的日历 profile 选择排队时间表（每天编译一次），否则用乐园的 all time 表
+        self.wait_model = wait_model
+        # 不为 None 时，ACO 求解的请求从相似的历史请求热启动，并把结果记录进去
+        self.pheromone_store = pheromone_store
+        self.param_program = {**PARAM_PROGRAM, **(param_program or {})}
+        self.rho = rho or RHO
+        self.param_ant = param_ant or PARAM_ANT
+        self.m = m
+
+        # set id of attractions
+        self.attractions = park.valid_rides
+        self.No = {attraction: i for i, attraction in enumerate(self.attractions)}
+        self.open_time = park.open_time
+        if np.ndim(stay_time) == 0:
+            stay_time = [stay_time] * len(self.attractions)
+        self.stay_time = list(stay_time)
+        self.stay_array = np.asarray(self.stay_time, dtype=float)
+        self.release_array = np.zeros(len(self.attractions))
+        self.deadline_array = np.full(len(self.attractions), np.inf)
+        self._load_tables()
+
+        self._neighborhoods = {}
+        self._executor = None
+
+    # 由乐园数据得到的查找表，mmap 加载的 CompiledPark 直接引用映射的页面
+    _TABLES = ("travel_time", "wait_profile", "profile_end", "wait_array", "travel_array")
+
+    def _load_tables(self):
+        self.travel_time = self.park.walking_time
+        # 按分钟预编译的排队时间表，行号与 No 一致
+        self.wait_profile = self.park.compile_wait_profile()
+        self.profile_end = len(self.wait_profile[0]) - 1
+        self.wait_array = np.asarray(self.wait_profile)
+        self.travel_array = np.asarray(self.travel_time)
+
+    # ---------------- worker pool ----------------
+    @property
+    def workers(self):
+        return self.param_program["workers"]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_executor"] = None
+        if getattr(self.park, "path", None) is not None:
+            # 从二进制文件加载的乐园只传路径，接收方重新 mmap，不拷贝查找表
+            for name in self._TABLES:
+                del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if "wait_array" not in state:
+            self._load_tables()
+
+    def _get_executor(self):
+        if self._executor is None:
+            # 乐园数据只在进程启动时发送一次
+            self._executor = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self,))
+        return self._executor
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------------- cost evaluation ----------------
+    def wait_table(self, state: PlanState) -> np.ndarray:
+        # 本次请求使用的排队时间表
+        return self.wait_array if state.wait_array is None else state.wait_array
+
+    def travel_table(self, state: PlanState) -> np.ndarray:
+        # 本次请求使用的步行时间表（有活动时带上活动的行和列）
+        return self.travel_array if state.travel_array is None else state.travel_array
+
+    def stay_table(self, state: PlanState) -> np.ndarray:
+        return self.stay_array if state.stay_array is None else state.stay_array
+
+    def release_table(self, state: PlanState) -> np.ndarray:
+        # 各项目最早开始排队的时刻，没有时间窗口时为 0（开园）
+        return self.release_array if state.release_array is None else state.release_array
+
+    def deadline_table(self, state: PlanState) -> np.ndarray:
+        # 各项目最晚开始排队的时刻，没有时间窗口时为 inf
+        return self.deadline_array if state.deadline_array is None else state.deadline_array
+
+    def day_table(self, day: date) -> np.ndarray:
+        # 某一天的排队时间表，WaitModel 对同一组 profile 只编译一次
+        if self.wait_model is None:
+            return self.wait_array
+        return self.wait_model.compile(day)
+
+    def live_wait_table(self, wait_overrides: dict[str, float], minute: float, base: np.ndarray = None) -> np.ndarray:
+        """
+        用实时排队时间修正排队时间表 base（默认 wait_array）：wait_overrides 为 {项目: 在 minute 时刻观测到的排队时间}，
+        观测值与预测值的差从 minute 起在 PARAM_PROGRAM["liveWaitDecay"] 分钟内线性衰减到 0（见 LiveOverride），
+        之前的时刻和项目关闭的时刻不变。返回修正后的整张表（拷贝）。
+        """
+        table = np.array(self.wait_array if base is None else base, dtype=np.float64)
+        minutes = np.arange(self.profile_end, dtype=np.float64)  # 末尾的哨兵不变
+        for attraction, wait in wait_overrides.items():
+            ride_id = self.No[attraction]
+            layer = LiveOverride(None, wait, minute, self.param_program["liveWaitDecay"])
+            table[ride_id, :-1] = layer.adjust(table[ride_id, :-1], minutes)
+        return table
+
+    def construct_routes(self, state: PlanState, ant_key: tuple[str, str], ant_num: int, pheromone: Pheromone,
+                         rng: np.random.Generator):
+        """
+        同一 (stage, type) 的 ant_num 只蚂蚁一起逐步构造路线（stochastic / deterministic）。
+        每一步对所有蚂蚁计算 (ants, attractions) 的权重矩阵 F^alpha * C^-beta * LF^gamma，
+        已访问的项目权重置 0，stochastic 蚂蚁按累积和做轮盘赌，deterministic 蚂蚁取最大权重。
+        PARAM_ANT 中设置了 "candidates": k 的蚂蚁每一步只给当前位置的 k 个候选项目（见 candidate_lists）打分，
+        候选项目都访问过的蚂蚁才退回到所有项目中选择。
+        返回 routes[a, t]（attractions_to_visit 中的下标）和各蚂蚁的路线总时长。
+        """
+        params = self.param_ant[ant_key]
+        n = len(state.attractions_to_visit)
+        rows = np.arange(ant_num)
+        cols = np.arange(n)
+        k = params.get("candidates")
+        candidates = self.candidate_lists(state, k) if k and k < n else None
+
+        # 本次请求涉及的子矩阵: 出发点为 n 号节点
+        travel = self.travel_table(state)[np.ix_(state.node_ids, state.ride_ids)]
+        wait = self.wait_table(state)[state.ride_ids]
+        stay = self.stay_table(state)[state.ride_ids]
+        release = self.release_table(state)[state.ride_ids]
+        deadline = self.deadline_table(state)[state.ride_ids]
+        # 有时间窗口的节点：选了某个项目之后，从它出发已经赶不上某个还没去的窗口，就不选它
+        constrained = np.flatnonzero(np.isfinite(state.deadlines)) if state.deadlines is not None else []
+        if len(constrained):
+            deadline_travel = travel[:n, constrained]  # (n, 有窗口的节点)
+            deadlines = state.deadlines[constrained]
+        if candidates is None:
+            attractiveness = pheromone.F ** params['alpha'] * pheromone.LF ** params['gamma']
+
+        routes = np.empty((ant_num, n), dtype=np.intp)
+        route_length = np.zeros(ant_num)
+        clock = np.full(ant_num, state.start_minute, dtype=float)
+        current_pos = np.full(ant_num, n, dtype=np.intp)
+        visited = np.zeros((ant_num, n), dtype=bool)
+
+        def choose(t, sel, options):
+            # 为 sel 中的蚂蚁选下一个项目；options 为 None 时在所有项目中选，否则只在 options[a] 中选
+            pos = current_pos[sel]
+            if options is None:
+                # 窗口开始前到达的要等到窗口开始，这段时间算在路途用时里
+                T_travel = np.maximum(travel[pos], release - clock[sel, None])
+                arrival = np.minimum(np.floor(clock[sel, None] + T_travel), self.profile_end).astype(np.intp)
+                C = np.where(clock[sel, None] + T_travel > deadline, np.inf, T_travel + wait[cols, arrival] + stay)
+                if candidates is None:
+                    weights = attractiveness[t, pos]
+                else:
+                    weights = pheromone.F[t, pos] ** params['alpha'] * pheromone.LF[t, pos] ** params['gamma']
+                weights = weights * C ** (-params['beta'])
+                weights[visited[sel]] = 0.0
             else:
-                stage = "main"
-
-        # create ants
-        explored_routes = []
-        route_len = []
-        ants = []
-        for ant_key in PARAM_ANT.keys():
-            if stage in ant_key:
-                ant_num = PARAM_ANT[ant_key]["count"]
-                ant_type = ant_key[1]
+                T_travel = np.maximum(travel[pos[:, None], options], release[options] - clock[sel, None])
+                arrival = np.minimum(np.floor(clock[sel, None] + T_travel), self.profile_end).astype(np.intp)
+                C = np.where(clock[sel, None] + T_travel > deadline[options], np.inf,
+                             T_travel + wait[options, arrival] + stay[options])
+                weights = (pheromone.F[t, pos[:, None], options] ** params['alpha']
+                           * pheromone.LF[t, pos[:, None], options] ** params['gamma'] * C ** (-params['beta']))
+                weights[visited[sel[:, None], options]] = 0.0
+            if len(constrained):
+                # finish + travel[j, c] > deadline[c] 且 c 还没去（c 就是 j 自己时除外）
+                finish = clock[sel, None] + C
+                targets = cols if options is None else options
+                late = (finish[..., None] + deadline_travel[targets] > deadlines) & ~visited[sel][:, None, constrained]
+                late &= targets[..., None] != constrained
+                weights[late.any(axis=2)] = 0.0
+            # 全部打分时只有未访问的 n - t 个项目算作一次代价计算
+            state.evaluations += len(sel) * (n - t) if options is None else C.size
+            dead = ~(weights > 0).any(axis=1)
+            if dead.any() and options is not None:
+                # 候选项目都不能选（访问过、已关闭或会赶不上时间窗口）的蚂蚁退回到所有项目中选择
+                next_attraction = np.empty(len(sel), dtype=np.intp)
+                T_delta = np.empty(len(sel))
+                next_attraction[dead], T_delta[dead] = choose(t, sel[dead], None)
+                alive = ~dead
+                if alive.any():
+                    next_attraction[alive], T_delta[alive] = pick(sel[alive], options[alive], weights[alive],
+                                                                  C[alive])
+                return next_attraction, T_delta
+            if dead.any():
+                # 剩下的项目到达时都已关闭的蚂蚁（路线已不可行）在未访问的项目中随便选一个
+                weights[dead] = ~visited[sel][dead]
+            return pick(sel, options, weights, C)
+
+        def pick(sel, options, weights, C):
+            if ant_key[1] == "stochastic":
+                cumulative = np.cumsum(weights, axis=1)
+                u = rng.random(len(sel)) * cumulative[:, -1]
+                chosen = np.argmax(cumulative > u[:, None], axis=1)
+            else:
+                chosen = np.argmax(weights, axis=1)
+            r = np.arange(len(sel))
+            next_attraction = chosen if options is None else options[r, chosen]
+            return next_attraction, C[r, chosen]
+
+        for t in range(n):
+            if candidates is None:
+                next_attraction, T_delta = choose(t, rows, None)
             else:
+                next_attraction = np.empty(ant_num, dtype=np.intp)
+                T_delta = np.empty(ant_num)
+                # 路线已不可行（clock 为 inf）的蚂蚁用最后一个小时的候选列表
+                last_bucket = candidates.shape[1] - 1
+                bucket = (np.minimum(clock, last_bucket * 60) // 60).astype(np.intp)
+                options = candidates[current_pos, bucket]
+                exhausted = visited[rows[:, None], options].all(axis=1)
+                for sel, opts in ((rows[~exhausted], options[~exhausted]), (rows[exhausted], None)):
+                    if len(sel):
+                        next_attraction[sel], T_delta[sel] = choose(t, sel, opts)
+            routes[:, t] = next_attraction
+            visited[rows, next_attraction] = True
+            current_pos = next_attraction
+            clock += T_delta
+            route_length += T_delta
+
+        return routes, route_length
+
+    def candidate_lists(self, state: PlanState, k: int) -> np.ndarray:
+        """
+        候选列表 candidates[i, h]：从节点 i（n 为起点）在开园后第 h 个小时出发时，
+        步行时间 + 该小时平均排队时间（包括等到时间窗口开始的时间）+ 游玩时间最小的 k 个项目（不含 i 自己）。
+        每个请求只计算一次。
+        """
+        if k not in state.candidates:
+            n = len(state.attractions_to_visit)
+            hours = self.profile_end // 60
+            travel = self.travel_table(state)[np.ix_(state.node_ids, state.ride_ids)]
+            minutes = np.arange(hours * 60)
+            early = np.maximum(self.release_table(state)[state.ride_ids, None] - minutes, 0.0)
+            early[minutes > self.deadline_table(state)[state.ride_ids, None]] = np.inf
+            hourly_wait = (self.wait_table(state)[state.ride_ids, :hours * 60] + early).reshape(n, hours, 60).mean(axis=2)
+            cost = travel[:, None, :] + hourly_wait.T[None, :, :] + self.stay_table(state)[state.ride_ids]
+            diagonal = np.arange(n)
+            cost[diagonal, :, diagonal] = np.inf
+            state.candidates[k] = np.argpartition(cost, k - 1, axis=2)[..., :k]
+        return state.candidates[k]
+
+    def _neighborhood(self, n: int):
+        # 长度为 n 的路线的全部邻域解，表示为位置的排列 perm (K, n) 及每个解第一个/最后一个改动的位置
+        key = (n, tuple(self.param_program["neighborhoods"]))
+        if key not in self._neighborhoods:
+            moves = list(neighbors(list(range(n)), key[1]))
+            perm = np.array([m[0] for m in moves], dtype=np.intp).reshape(len(moves), n)
+            first = np.array([m[1] for m in moves], dtype=np.intp)
+            last = np.array([m[2] for m in moves], dtype=np.intp)
+            self._neighborhoods[key] = perm, first, last
+        return self._neighborhoods[key]
+
+    def local_search(self, state: PlanState, route: list[int]):
+        """
+        对一条编码路线做 best-improvement 局部搜索，直到所有邻域都找不到更短的路线。
+        缓存当前路线每个位置的结束时刻，所有邻域解一起逐位置计算，且只从各自第一个改动的位置开始；
+        进入未改动的后缀后，一旦结束时刻不早于原路线（FIFO：之后不可能再追回来），
+        或者已经不短于目前最好的路线，就提前放弃这个邻域解。
+        搜索是确定性的，途经的每条路线都记入 state.search_cache，之后从其中任意一条出发都直接返回结果。
+        返回 (route, route_length)。
+        """
+        path = [tuple(route)]
+        result = state.search_cache.get(path[0])
+        if result is None:
+            result = self._local_search(state, route, path)
+            for key in path:
+                state.search_cache.put(key, result)
+        return list(result[0]), result[1]
+
+    def _local_search(self, state: PlanState, route: list[int], path: list):
+        n = len(route)
+        if n < 2:
+            return tuple(route), float(self.schedule(state, route)[-1] - state.start_minute)
+        perm, first, last = self._neighborhood(n)
+        travel = self.travel_table(state)[np.ix_(state.node_ids, state.ride_ids)]
+        wait = self.wait_table(state)[state.ride_ids]
+        stay = self.stay_table(state)[state.ride_ids]
+        release = self.release_table(state)[state.ride_ids]
+        deadline = self.deadline_table(state)[state.ride_ids]
+        start = state.start_minute
+
+        route = np.asarray(route, dtype=np.intp)
+        ends = self.schedule(state, route)
+        while True:
+            # 起点 (位置 -1) 的结束时刻就是出发时刻
+            ends_from_start = np.concatenate(([start], ends))
+            best_end = ends[-1]
+            candidates = route[perm]
+            rows = np.arange(len(perm))
+            clock = ends_from_start[first]
+            prev = np.where(first > 0, candidates[rows, first - 1], n)
+            candidate_first = first
+            candidate_last = last
+            for k in range(candidate_first.min(), n):
+                # 只计算还没有被放弃、且已经走到第一个改动位置的邻域解
+                active = candidate_first <= k
+                state.evaluations += int(active.sum())
+                node = candidates[rows, k]
+                arrival = np.maximum(clock + travel[prev, node], release[node])
+                minute = np.minimum(arrival, self.profile_end).astype(np.intp)
+                new_clock = np.where(arrival > deadline[node], np.inf, arrival + wait[node, minute] + stay[node])
+                clock = np.where(active, new_clock, clock)
+                prev = np.where(active, node, prev)
+                alive = (clock < best_end) & ((candidate_last >= k) | (clock < ends[k]))
+                if not alive.all():
+                    rows, clock, prev = rows[alive], clock[alive], prev[alive]
+                    candidate_first, candidate_last = candidate_first[alive], candidate_last[alive]
+                    if len(rows) == 0:
+                        break
+            # update best solution if it's obtained
+            if len(rows) == 0 or clock.min() >= best_end - 1e-9:
+                break
+            route = candidates[rows[np.argmin(clock)]]
+            key = tuple(route.tolist())
+            known = state.search_cache.get(key)
+            if known is not None:
+                return known
+            path.append(key)
+            ends = self.schedule(state, route)
+
+        return tuple(route.tolist()), float(ends[-1] - start)
+
+    def schedule(self, state: PlanState, route) -> np.ndarray:
+        # 编码路线上每个项目玩完时的时刻（距开园的分钟数）
+        state.evaluations += len(route)
+        ends = np.empty(len(route))
+        wait, travel, stay = self.wait_table(state), self.travel_table(state), self.stay_table(state)
+        release, deadline = self.release_table(state), self.deadline_table(state)
+        clock = state.start_minute
+        prev = state.node_ids[-1]
+        for k, node in enumerate(state.ride_ids[route]):
+            arrival = max(clock + travel[prev, node], release[node])
+            minute = int(min(arrival, self.profile_end))
+            clock = arrival + wait[node, minute] + stay[node] if arrival <= deadline[node] else np.inf
+            ends[k] = clock
+            prev = node
+        return ends
+
+    def end_times(self, state: PlanState, route) -> list[datetime]:
+        # schedule 换算成 datetime，作为结果输出
+        return [state.to_datetime(minute) for minute in self.schedule(state, route).tolist()]
+
+    def evaluate_routes(self, state: PlanState, routes: np.ndarray) -> np.ndarray:
+        # 批量计算 (K, n) 编码路线的总时长
+        routes = np.asarray(routes, dtype=np.intp)
+        state.evaluations += routes.size
+        wait, travel, stay = self.wait_table(state), self.travel_table(state), self.stay_table(state)
+        release, deadline = self.release_table(state), self.deadline_table(state)
+        clock = np.full(len(routes), state.start_minute, dtype=float)
+        prev = np.full(len(routes), state.node_ids[-1])
+        for node in state.ride_ids[routes].T:
+            arrival = np.maximum(clock + travel[prev, node], release[node])
+            minute = np.minimum(arrival, self.profile_end).astype(np.intp)
+            clock = np.where(arrival > deadline[node], np.inf, arrival + wait[node, minute] + stay[node])
+            prev = node
+        return clock - state.start_minute
+
+    def route_lengths(self, state: PlanState, routes: list[list[int]]) -> list[float]:
+        # 带缓存的 evaluate_routes：缓存中没有的路线一起批量计算后存入缓存
+        keys = [tuple(route) for route in routes]
+        lengths = [state.length_cache.get(key) for key in keys]
+        missing = [k for k, length in enumerate(lengths) if length is None]
+        if missing:
+            computed = self.evaluate_routes(state, [routes[k] for k in missing]).tolist()
+            for k, length in zip(missing, computed):
+                lengths[k] = length
+                state.length_cache.put(keys[k], length)
+        return lengths
+
+    def run_colony(self, state: PlanState, stage: str, ant_counts: dict, pheromone: Pheromone,
+                   rng: np.random.Generator, improve: bool, out: Colony = None) -> Colony:
+        """
+        构造一组蚂蚁（elite 蚂蚁由调用方补上），并对其中最好的一只做局部搜索。
+        结果写入 out（先 reset），out 为 None 时新建一个正好能放下这些蚂蚁的 Colony。
+        """
+        n = len(state.attractions_to_visit)
+        ant_keys = list(self.param_ant)
+        if out is None:
+            out = Colony(sum(ant_counts.values()), n, ant_keys)
+        out.reset()
+        evaluations = state.evaluations
+        hits, misses = state.cache_hits, state.cache_misses
+        construction_start = perf_counter()
+        random_blocks = []
+        for ant_key, ant_num in ant_counts.items():
+            if ant_num == 0:
                 continue
+            block = out.add(ant_keys.index(ant_key), ant_num)
+            if ant_key[1] in ["stochastic", "deterministic"]:
+                # construct routes for all ants of this kind at once
+                out.routes[block], out.lengths[block] = self.construct_routes(state, ant_key, ant_num, pheromone, rng)
+            else:
+                out.routes[block] = np.arange(n)
+                rng.permuted(out.routes[block], axis=1, out=out.routes[block])
+                random_blocks.append(block)
+        for block in random_blocks:
+            # 随机蚂蚁尽量不与本组已构造的路线重复：重复的重新打乱，最多 10 次
+            for _ in range(10):
+                _, first = np.unique(out.routes[:out.size], axis=0, return_index=True)
+                duplicate = np.ones(out.size, dtype=bool)
+                duplicate[first] = False
+                redo = np.flatnonzero(duplicate[block]) + block.start
+                if len(redo) == 0:
+                    break
+                out.routes[redo] = rng.permuted(out.routes[redo], axis=1)
+            out.lengths[block] = self.route_lengths(state, out.routes[block].tolist())
 
-            for ant_id in range(ant_num):
-                # create an ant
-                if ant_type == "elite":
-                    ant = Ant(ant_key)
-                    ant.route = best_route
-                    ant.route_length = min_route_len
-                    explored_routes.append(best_route)
-                    route_len.append(min_route_len)
-                else:
-                    # construct route for this ant
-                    ant = Ant(ant_key)
-                    ant.construct_route(explored_routes, F, LF)
-                    explored_routes.append(ant.route)
-                    route_len.append(ant.route_length)
-                ants.append(ant)
-
-        # find best solution in this interation
-        min_route_len_of_iteration = min(route_len)
-        id_in_list = route_len.index(min_route_len_of_iteration)
-        best_ant_in_a_iter = ants[id_in_list]
+        # find best solution in this colony
+        best_id = out.best()
+        local_search_start = perf_counter()
 
         # do local research
-        if PARAM_PROGRAM['improvePath']:
-            improved_ant = local_search(best_ant_in_a_iter)
-            explored_routes[id_in_list] = improved_ant.route
-            route_len[id_in_list] = improved_ant.route_length
-        else:
-            improved_ant = best_ant_in_a_iter
+        if improve:
+            route, out.lengths[best_id] = self.local_search(state, out.routes[best_id].tolist())
+            out.routes[best_id] = route
 
-        # check whether the best solution has been improved
-        if improved_ant.route_length >= min_route_len:
-            if stagn_start_iter == -1:
-                stagn_start_iter = l
-        else:
-            min_route_len = improved_ant.route_length
-            best_ant = improved_ant
-            # print(min_route_len)    # print optimization process
-            best_route = improved_ant.route
-            if stage == "stagnate":
-                stagn_start_iter = -1
-
-        # update pheromones
-        # update F
-        for key in F:
-            F[key] = F[key] * RHO[stage]
-
-        for ant in ants:
-            route = ant.route
-            for j in range(len(route)):
-                if j == 0:
-                    F[current_pos, route[j], 1] += (1 - RHO[stage]) / (M * ant.route_length)
+        out.evaluations = state.evaluations - evaluations
+        out.cache_hits = state.cache_hits - hits
+        out.cache_misses = state.cache_misses - misses
+        out.construction_time = local_search_start - construction_start
+        out.local_search_time = perf_counter() - local_search_start
+        return out
+
+    # ---------------- planning ----------------
+    def held_karp(self, state: PlanState):
+        """
+        时间依赖的 Held-Karp 动态规划：finish[mask, j] 为访问完集合 mask、最后一个是 j 时最早的结束时刻。
+        排队时间表满足 FIFO（晚到不会更早玩完）时，每个状态只保留最早结束时刻就能得到最优解；
+        排队时间按到达的整分钟查表，同一分钟内早到一点可能反而晚玩完（不到 1 分钟），此时结果可能比最优解略长。
+        按集合大小逐层计算，每层对所有集合和上一个项目一起向量化。返回 (编码路线, 总时长)。
+        需要 2^n * n 个状态，n 较小时才适用。
+        """
+        n = len(state.attractions_to_visit)
+        if n == 0:
+            return [], 0.0
+        travel = self.travel_table(state)[np.ix_(state.node_ids, state.ride_ids)]
+        wait = self.wait_table(state)[state.ride_ids]
+        stay = self.stay_table(state)[state.ride_ids]
+        release = self.release_table(state)[state.ride_ids]
+        deadline = self.deadline_table(state)[state.ride_ids]
+        finish = np.full((1 << n, n), np.inf)
+        parent = np.full((1 << n, n), -1, dtype=np.int8)
+
+        def leg(clock, prev, j):
+            # 与 evaluate_routes 相同的计算顺序，保证结果完全一致
+            arrival = np.maximum(clock + travel[prev, j], release[j])
+            minute = np.minimum(arrival, self.profile_end).astype(np.intp)
+            return np.where(arrival > deadline[j], np.inf, arrival + wait[j, minute] + stay[j])
+
+        for j in range(n):
+            finish[1 << j, j] = leg(np.float64(state.start_minute), n, j)
+        masks = np.arange(1 << n)
+        popcount = np.array([bin(mask).count("1") for mask in range(1 << n)])
+        state.evaluations += n
+        for size in range(1, n):
+            layer = masks[popcount == size]
+            clock = finish[layer]  # (masks, n)，不在 mask 中的项目为 inf
+            for j in range(n):
+                sources = layer[(layer >> j) & 1 == 0]
+                if len(sources) == 0:
+                    continue
+                rows = np.searchsorted(layer, sources)
+                candidates = leg(clock[rows], np.arange(n), j)
+                best = np.argmin(candidates, axis=1)
+                targets = sources | (1 << j)
+                finish[targets, j] = candidates[np.arange(len(sources)), best]
+                parent[targets, j] = best
+                state.evaluations += len(sources) * size
+
+        # 从最后一个项目倒推路线
+        mask = (1 << n) - 1
+        last = int(np.argmin(finish[mask]))
+        if not np.isfinite(finish[mask, last]):
+            raise ValueError("No route reaches every attraction before it closes")
+        total_time = float(finish[mask, last] - state.start_minute)
+        route = []
+        while last >= 0:
+            route.append(last)
+            mask, last = mask ^ (1 << last), int(parent[mask, last])
+        return route[::-1], total_time
+
+    def solve_exact(self, attractions_to_visit: list, start_time: str = "9:30",
+                    current_pos: str = "Fantasia Carousel", windows: dict[str, tuple] = None,
+                    events: list[FixedEvent] = None) -> PlanResult:
+        # 用 held_karp 求精确最优解
+        return self._solve_exact(PlanState(self, attractions_to_visit, start_time, current_pos, seed=0,
+                                           windows=windows, events=events))
+
+    def _solve_exact(self, state: PlanState) -> PlanResult:
+        route, total_time = self.held_karp(state)
+        return PlanResult(route=[state.attractions_to_visit[k] for k in route], total_time=total_time,
+                          evaluations=state.evaluations, stop_reason="exact", schedule=self.end_times(state, route),
+                          start_pos=state.start_pos, start_minute=state.start_minute,
+                          day=state.open_datetime.date(),
+                          windows=state.windows, events=state.events)
+
+    def solve(self, attractions_to_visit: list, start_time: str = "9:30", current_pos: str = "Fantasia Carousel",
+              seed: int = None, callback: Callable[[IterationEvent], None] = None,
+              time_budget: float = None, windows: dict[str, tuple] = None,
+              events: list[FixedEvent] = None) -> PlanResult:
+        """
+        求解一次请求。callback 不为 None 时，每次迭代结束后以 IterationEvent 调用一次
+        （例如传入 ConvergenceTrace 记录收敛过程）。
+
+        windows / events 为时间约束（见 PlanState）：项目的到达时间窗口和固定时间的活动，
+        活动会以名称出现在路线中。构造路线时直接排除会错过窗口的选择；没有可行路线时抛出 ValueError。
+
+        time_budget（秒，默认取 PARAM_PROGRAM["timeBudget"]）不为 None 时按墙钟时间求解：
+        每次迭代前按已测得的单次迭代耗时估计还能跑几次，init / final 阶段和停滞判定的迭代数按比例压缩，
+        预计下一次迭代会超时就停止，返回目前最好的路线。此时迭代次数与机器速度有关，结果不再只由 seed 决定。
+
+        要访问的项目不超过 PARAM_PROGRAM["exactMax"] 个时直接用 solve_exact 求精确解，不调用 callback。
+        """
+        if len(attractions_to_visit) + len(events or []) <= self.param_program["exactMax"]:
+            return self.solve_exact(attractions_to_visit, start_time, current_pos, windows, events)
+        # 不指定 seed 时由 random 模块派生，保证 random.seed 之后整个求解可复现
+        if seed is None:
+            seed = random.getrandbits(64)
+        state = PlanState(self, attractions_to_visit, start_time, current_pos, seed, windows=windows, events=events)
+        # 有时间约束的请求不与其它请求共享热启动记录
+        store = self.pheromone_store if state.deadlines is None else None
+        return self._run_aco(state, callback=callback, time_budget=time_budget, store=store)
+
+    def replan(self, previous: PlanResult, current_time: "str | datetime | float", current_pos: str = None,
+               remaining: list[str] = None, wait_overrides: dict[str, float] = None, iterations: int = 20,
+               seed: int = None, callback: Callable[[IterationEvent], None] = None,
+               time_budget: float = None, windows: dict[str, tuple] = None,
+               events: list[FixedEvent] = None) -> PlanResult:
+        """
+        游玩途中从游客的当前状态重新规划剩下的路线。
+        previous: 上一次 solve / replan 的结果；current_time: 现在的时刻（"H:MM"、datetime 或距开园的分钟数，
+        不是 datetime 时为上一次规划的那一天）；
+        current_pos: 现在所在的位置，默认为上一次的出发位置；remaining: 还要玩的项目，默认为上一条路线中
+        current_pos 之后的项目（包括还没参加的活动）；wait_overrides: {项目: 现在的实时排队时间}，见 live_wait_table。
+        windows / events 默认沿用上一次的；不指定 events 时只保留 remaining 中的活动。
+
+        不从头求解，而是把上一次的信息素投影到剩下的项目上，只跑 iterations 次迭代（没有 init 阶段）。
+        剩下的项目不超过 PARAM_PROGRAM["exactMax"] 个时直接求精确解。
+        """
+        if current_pos is None:
+            current_pos = previous.start_pos
+        previous_events = {event.name: event for event in previous.events or []}
+        position = current_pos
+        # 活动不能作为当前位置，用它所在的项目
+        if current_pos in previous_events:
+            current_pos = previous_events[current_pos].location
+        if remaining is None:
+            route = previous.route
+            remaining = route[route.index(position) + 1:] if position in route else list(route)
+        if events is None:
+            events = [previous_events[name] for name in remaining if name in previous_events]
+        event_names = {event.name for event in events}
+        rides = [name for name in remaining if name not in event_names]
+        windows = {ride: window for ride, window in (windows if windows is not None else previous.windows or {}).items()
+                   if ride in rides}
+        if not rides and not events:
+            raise ValueError("No attractions left to visit")
+        if seed is None:
+            seed = random.getrandbits(64)
+        state = PlanState(self, rides, current_time, current_pos, seed, wait_overrides, windows, events, previous.day)
+        n = len(state.attractions_to_visit)
+        if n <= self.param_program["exactMax"]:
+            return self._solve_exact(state)
+
+        pheromone = None
+        if previous.pheromone is not None:
+            visited = max(len(previous.route) - n, 0)
+            pheromone = previous.pheromone.project(state.node_ids, shift=visited)
+        # 上一条路线中剩下项目的原顺序（新加的项目排在最后）作为初始的全局最好路线
+        order = {ride: k for k, ride in enumerate(previous.route)}
+        initial_route = sorted(range(n), key=lambda k: order.get(state.attractions_to_visit[k], len(order)))
+        program = dict(self.param_program, maxTime=iterations, initTime=0,
+                       finishTime=min(self.param_program["finishTime"], iterations // 4 + 1),
+                       stagnCounter=min(self.param_program["stagnCounter"], iterations // 2 + 1))
+        return self._run_aco(state, pheromone, callback=callback, time_budget=time_budget, program=program,
+                             initial_route=initial_route)
+
+    def _run_aco(self, state: PlanState, pheromone: Pheromone = None, callback=None, time_budget: float = None,
+                 program: dict = None, store: PheromoneStore = None, initial_route: list[int] = None) -> PlanResult:
+        """
+        蚁群算法主循环。pheromone 为 None 时从均匀的信息素开始；program 覆盖 PARAM_PROGRAM；
+        initial_route（编码路线）不为 None 时作为初始的全局最好路线；store 不为 None 时从中热启动并记录结果。
+        """
+        attractions_to_visit = state.attractions_to_visit
+        seed = state.seed
+        rng = np.random.default_rng(seed)
+        PARAM_PROGRAM = program or self.param_program
+        PARAM_ANT = self.param_ant
+        RHO = self.rho
+
+        if pheromone is None:
+            pheromone = Pheromone(len(attractions_to_visit), dtype=PARAM_PROGRAM["pheromoneDtype"],
+                                  node_ids=state.node_ids)
+        workers = self.workers
+        executor = self._get_executor() if workers > 1 else None
+
+        # 所有蚂蚁的路线放在一个预先分配的 Colony 里，每次迭代重复使用
+        ant_keys = list(PARAM_ANT)
+        capacity = max(sum(PARAM_ANT[ant_key]["count"] for ant_key in ant_keys if ant_key[0] == stage)
+                       for stage in RHO)
+        colony = Colony(capacity, len(attractions_to_visit), ant_keys)
+        # 各种蚂蚁的 LR，没有 LR 的（随机蚂蚁）为 nan；最后一个是热启动 / 重新规划给定的初始路线，也没有 LR
+        LR_of_kind = np.array([PARAM_ANT[ant_key].get("LR", np.nan) for ant_key in ant_keys] + [np.nan], dtype=float)
+        seeded_kind = len(ant_keys)
+
+        stagn_start_iter = -1
+        best_route = None  # 编码路线，最后才解码成项目名称
+        min_route_len = 1e8
+        warm_start = False
+        best_kind = None  # 找到全局最好路线的蚂蚁种类（LR_of_kind 中的下标）
+        if initial_route is not None:
+            min_route_len = self.route_lengths(state, [initial_route])[0]
+            best_route = np.array(initial_route, dtype=np.intp)
+            best_kind = seeded_kind
+        if store is not None:
+            entry = store.lookup(state)
+            if entry is not None:
+                seed_route, min_route_len = store.seed(self, state, pheromone, entry)
+                best_route = np.array(seed_route, dtype=np.intp)
+                best_kind = seeded_kind
+                warm_start = True
+        ants = 0
+        evaluations = 0
+        cache_hits = 0
+        cache_misses = 0
+
+        max_time = PARAM_PROGRAM["maxTime"]
+        budget = time_budget if time_budget is not None else PARAM_PROGRAM["timeBudget"]
+        solve_start = perf_counter()
+        planned = max_time  # 预计的总迭代次数，有时间预算时每次迭代前重新估计
+        stage_times = {}  # 各阶段最近一次迭代的耗时
+        stage = None
+        last_improved = 0
+        stop_reason = None
+
+        l = 0
+        while stop_reason is None:
+            iteration_start = perf_counter()
+            previous_stage = stage
+            if budget is not None and l > 0:
+                # 保守地按最慢阶段的耗时估计
+                per_iteration = max(stage_times.values())
+                planned = min(max_time, l + int((budget - (iteration_start - solve_start)) / per_iteration))
+            if l >= planned:
+                stop_reason = "maxTime" if planned == max_time else "timeBudget"
+                break
+            init_time = _compress(PARAM_PROGRAM["initTime"], planned, max_time)
+            # final 阶段是最后 finishTime - 1 次迭代
+            final_iterations = _compress(PARAM_PROGRAM["finishTime"] - 1, planned, max_time)
+            stagn_counter = _compress(PARAM_PROGRAM["stagnCounter"], planned, max_time)
+
+            # 预计的迭代次数会变化，阶段只往前走：离开 init 后不再回到 init，进入 final 后一直是 final
+            if l < init_time and stage in (None, "init"):
+                stage = "init"
+            elif l >= planned - final_iterations or stage == "final":
+                stage = "final"
+            else:
+                if stagn_start_iter >= 0 and l - stagn_start_iter >= stagn_counter:
+                    stage = "stagnate"
                 else:
-                    F[route[j - 1], route[j], j + 1] += (1 - RHO[stage]) / (M * ant.route_length)
+                    stage = "main"
 
-        # update LF
-        if stage != "init" and stage != "stagnate":
-            for key in LF:
-                LF[key] = LF[key] * RHO[stage]
-            for ant in ants:
-                route = ant.route
-                LR = ant.params['LR']
-                for j in range(min(LR, len(route))):
-                    if j == 0:
-                        LF[current_pos, route[j], 1] += (1 - RHO[stage]) / (M * ant.route_length) / (LR + 1)
-                    else:
-                        LF[route[j - 1], route[j], j + 1] += (1 - RHO[stage]) / (M * ant.route_length) * (LR - j) / (LR**2 + LR)
+            if budget is not None and l > 0:
+                expected = stage_times.get(stage, max(stage_times.values()))
+                if iteration_start - solve_start + expected > budget:
+                    stop_reason = "timeBudget"
+                    break
 
-    print(f"Total Time Needed (Estimates): {min_route_len} min")
+            # create ants
+            ant_counts = {ant_key: PARAM_ANT[ant_key]["count"] for ant_key in ant_keys
+                          if stage in ant_key and ant_key[1] != "elite"}
+            if executor is None:
+                self.run_colony(state, stage, ant_counts, pheromone, rng, PARAM_PROGRAM['improvePath'], out=colony)
+            else:
+                # 每个 worker 构造一部分蚂蚁并各自对其中最好的一只做局部搜索，结果在主进程合并
+                futures = [executor.submit(_run_colony_task, state, stage, chunk, pheromone,
+                                           PARAM_PROGRAM['improvePath'],
+                                           np.random.SeedSequence(seed, spawn_key=(l, c)))
+                           for c, chunk in enumerate(split_ant_counts(ant_counts, workers)) if any(chunk.values())]
+                colony.reset()
+                for future in futures:
+                    colony.extend(future.result())
 
-    return best_route
+            colony_end = perf_counter()
+            evaluations += colony.evaluations
+            cache_hits += colony.cache_hits
+            cache_misses += colony.cache_misses
 
+            for kind, ant_key in enumerate(ant_keys):
+                if stage in ant_key and ant_key[1] == "elite" and best_route is not None:
+                    block = colony.add(kind, PARAM_ANT[ant_key]["count"])
+                    colony.routes[block] = best_route
+                    colony.lengths[block] = min_route_len
 
-if __name__ == '__main__':
-    import json
-    from utils.ThemePark import ThemePark
+            size = colony.size
+            ants += size
+
+            # find best solution in this interation
+            id_in_list = colony.best()
+            min_route_len_of_iteration = float(colony.lengths[id_in_list])
+
+            # check whether the best solution has been improved
+            improved = min_route_len_of_iteration < min_route_len
+            if not improved:
+                if stagn_start_iter == -1:
+                    stagn_start_iter = l
+            else:
+                min_route_len = min_route_len_of_iteration
+                best_route = colony.routes[id_in_list].copy()
+                best_kind = colony.kinds[id_in_list]
+                last_improved = l
+                if stage == "stagnate":
+                    stagn_start_iter = -1
+
+            # update pheromones
+            local = stage != "init" and stage != "stagnate"
+            # 还没有找到可行路线时（项目关闭后才能到达）MMAS 没有全局最好路线，也不限制 F
+            feasible = best_route is not None and np.isfinite(min_route_len)
+            if PARAM_PROGRAM["pheromoneUpdate"] == "mmas" and feasible:
+                tau_min, tau_max = mmas_bounds(min_route_len, len(attractions_to_visit), self.m,
+                                               PARAM_PROGRAM["mmasPbest"])
+                if stage == "stagnate" and previous_stage != "stagnate":
+                    pheromone.reset(tau_max)
+            if PARAM_PROGRAM["pheromoneUpdate"] == "mmas":
+                global_every = PARAM_PROGRAM["mmasGlobalEvery"]
+                if feasible and global_every and (l + 1) % global_every == 0:
+                    routes = best_route[None, :]
+                    amount = np.array([(1 - RHO[stage]) / (self.m * min_route_len)])
+                    kinds = np.array([best_kind])
+                else:
+                    routes = colony.routes[id_in_list:id_in_list + 1]
+                    amount = np.array([(1 - RHO[stage]) / (self.m * min_route_len_of_iteration)])
+                    kinds = colony.kinds[id_in_list:id_in_list + 1]
+            else:
+                routes = colony.routes[:size]
+                amount = (1 - RHO[stage]) / (self.m * colony.lengths[:size])
+                kinds = colony.kinds[:size]
+            pheromone.evaporate(RHO[stage], local=local)
+            # update F
+            pheromone.deposit(routes, amount)
+            # update LF（随机蚂蚁和初始路线没有 LR，只会在 MMAS 中作为全局最好的路线出现，此时不更新 LF）
+            LR = LR_of_kind[kinds]
+            if local and not np.isnan(LR).any():
+                pheromone.deposit_local(routes, amount, LR)
+            if PARAM_PROGRAM["pheromoneUpdate"] == "mmas" and feasible:
+                pheromone.clamp(tau_min, tau_max)
+
+            if callback is not None:
+                iteration_end = perf_counter()
+                callback(IterationEvent(
+                    iteration=l, stage=stage, best_length=min_route_len,
+                    iteration_best=min_route_len_of_iteration, improved=improved,
+                    wall_time=iteration_end - iteration_start,
+                    phase_times={"colony": colony_end - iteration_start,
+                                 "construction": colony.construction_time,
+                                 "local_search": colony.local_search_time,
+                                 "pheromone": iteration_end - colony_end},
+                    ants=size, evaluations=colony.evaluations,
+                    stagnation_start=stagn_start_iter,
+                    stagnation_count=l - stagn_start_iter if stagn_start_iter >= 0 else 0,
+                    best_route=[attractions_to_visit[k] for k in best_route.tolist()]
+                    if best_route is not None else None))
+
+            stage_times[stage] = perf_counter() - iteration_start
+            l += 1
+            # 收敛判定
+            if PARAM_PROGRAM["patience"] is not None and l - 1 - last_improved >= PARAM_PROGRAM["patience"]:
+                stop_reason = "patience"
+            elif PARAM_PROGRAM["minEntropy"] is not None and pheromone.entropy() < PARAM_PROGRAM["minEntropy"]:
+                stop_reason = "minEntropy"
 
+        if best_route is None or not np.isfinite(min_route_len):
+            raise ValueError("No route found that reaches every attraction before it closes")
+        if store is not None:
+            store.record(state, pheromone, best_route.tolist(), min_route_len)
+        return PlanResult(route=[attractions_to_visit[k] for k in best_route.tolist()], total_time=min_route_len, iterations=l, warm_start=warm_start,
+                          ants=ants, evaluations=evaluations, stop_reason=stop_reason,
+                          schedule=self.end_times(state, best_route), cache_hits=cache_hits, cache_misses=cache_misses,
+                          start_pos=state.start_pos, start_minute=state.start_minute,
+                          day=state.open_datetime.date(), pheromone=pheromone,
+                          windows=state.windows, events=state.events)
+
+    def plan_route(self, attractions_to_visit: list,
+                   start_time: str = "9:30", current_pos: str = "Fantasia Carousel",
+                   callback: Callable[[IterationEvent], None] = None, time_budget: float = None):
+        result = self.solve(attractions_to_visit, start_time, current_pos, callback=callback,
+                            time_budget=time_budget)
+
+        print(f"Total Time Needed (Estimates): {result.total_time} min")
+
+        return result.route
+
+    def plan_many(self, requests: list[RouteRequest], seed: int = None) -> list[PlanResult]:
+        """
+        批量求解多个游客的请求，共用已编译的乐园数据。workers > 1 时每个请求在一个 worker 进程中
+        串行求解；每个请求的种子由 seed 和它在列表中的位置派生，结果与 worker 数无关。
+        """
+        if seed is None:
+            seed = random.getrandbits(64)
+        seeds = [int(s.generate_state(1, np.uint64)[0]) for s in np.random.SeedSequence(seed).spawn(len(requests))]
+        if self.workers > 1:
+            return list(self._get_executor().map(_solve_task, requests, seeds))
+        return [self.solve(r.attractions_to_visit, r.start_time, r.current_pos, seed=s, windows=r.windows,
+                           events=r.events)
+                for r, s in zip(requests, seeds)]
+
+
+# ---------------- worker processes ----------------
+# 进程池中的 worker 只在启动时接收一次规划器（含乐园数据），之后每个任务只传请求状态、信息素和随机种子
+_WORKER_PLANNER = None
+
+
+def _init_worker(planner: Planner):
+    global _WORKER_PLANNER
+    # worker 中的规划器不带进程池，也不再继续分发任务（fork 时会继承父进程的 _executor）
+    planner._executor = None
+    planner.param_program = {**planner.param_program, "workers": 1}
+    _WORKER_PLANNER = planner
+
+
+def _run_colony_task(state: PlanState, stage, ant_counts, pheromone, improve, seed: np.random.SeedSequence):
+    # 每个任务的种子由主种子和 (迭代, 分块) 决定，与任务被哪个 worker 执行无关
+    if state.wait_array is None and state.wait_day is not None:
+        state.wait_array = _WORKER_PLANNER.day_table(state.wait_day)
+    return _WORKER_PLANNER.run_colony(state, stage, ant_counts, pheromone, np.random.default_rng(seed), improve)
+
+
+def _solve_task(request: RouteRequest, seed: int):
+    return _WORKER_PLANNER.solve(request.attractions_to_visit, request.start_time, request.current_pos, seed=seed,
+                                 windows=request.windows, events=request.events)
+
+
+def _compress(iterations: int, planned: int, max_time: int):
+    # 按预计的总迭代次数等比例缩短某个阶段的迭代数，原本不为 0 的至少保留 1 次
+    if planned >= max_time:
+        return iterations
+    return max(min(iterations, 1), round(iterations * planned / max_time))
+
+
+def split_ant_counts(ant_counts: dict, parts: int):
+    # 把每种蚂蚁的数量尽量均匀地分到 parts 份中
+    return [{key: num // parts + (c < num % parts) for key, num in ant_counts.items()} for c in range(parts)]
+
+
+if __name__ == '__main__':
     with open("parks/ShanghaiDisney.json", "r", encoding="utf-8") as f:
         data = json.load(f)
 
     disney = ThemePark(**data)
-
-    # 读取一些全局变量
-    WAIT_TIME = disney.history_results
-    TRAVEL_TIME = disney.walking_time
+    planner = Planner(disney)
     ATTRACTIONS = disney.valid_rides
 
-    # 每个项目游玩的时间，这里做了简单化处理，认为都是10分钟
-    STAY_TIME = [10] * len(WAIT_TIME)
-
-    # set id of attractions
-    No = dict()
-    i = 0
-    for entertainment in WAIT_TIME:
-        No[entertainment] = i
-        i += 1
-
-    # set parameters
-    PARAM_PROGRAM = {"maxTime": 100, "finishTime": 10, "initTime": 10,
-                     "stagnCounter": 10, "improvePath": True}
-    RHO = {"init": 0.9, "main": 0.9, "stagnate": 0.3, "final": 0.5}
-    PARAM_ANT = {("init", "random"): {"count": 100},
-                 ("stagnate", "random"): {"count": 100},
-                 ("main", "stochastic"): {"alpha": 0.8, "beta": 0.7, "gamma": 0.9, "count": 200, "LR": 10},
-                 ("main", "deterministic"): {"alpha": 0.8, "beta": 0.8, "gamma": 0.5, "count": 50, "LR": 5},
-                 ("final", "stochastic"): {"alpha": 0.2, "beta": 0.2, "gamma": 0.5, "count": 150, "LR": 3},
-                 ("final", "stochastic"): {"alpha": 0.5, "beta": 0.1, "gamma": 0.1, "count": 100, "LR": 5}}
-
-    M = 1
-
     # ---------------- generate a random case ----------------
     random.seed(0)
     visit_attractions = random.sample(ATTRACTIONS, k=6)
@@ -333,5 +1424,5 @@ if __name__ == '__main__':
     print(f'Entertainments to visit: {visit_attractions}\n')
     # --------------------------------------------------------
 
-    result = plan_route(visit_attractions, start_time="9:30", current_pos=current_pos)
+    result = planner.plan_route(visit_attractions, start_time="9:30", current_pos=current_pos)
     print(f'Recommended route: {result}')
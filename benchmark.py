@@ -0,0 +1,180 @@
+"""
+plan_route 的性能基准：在随机生成的合成乐园上以固定种子求解，输出 JSON 结果便于对比不同版本。
+
+    python benchmark.py --sizes 10 20 50 --seeds 0 1 2 --output bench.json
+
+每个 (乐园规模, 种子) 随机选 --visit 个项目（给出 --visit-fraction 时按乐园规模的比例选），记录总耗时、每次迭代耗时、各阶段耗时、每秒构造的蚂蚁数、每秒代价函数计算次数、
+内存峰值，以及规模不超过 --exact-max 时与动态规划 (Planner.solve_exact) 求出的最优解的差距；--trace 时附带逐次迭代的收敛过程。
+项目关闭后不能再排队，关闭前玩不完所有项目的请求记为 "feasible": false。
+"""
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from ACO_for_TDTSP import ConvergenceTrace, Planner
+from utils.ThemePark import ThemePark, estimate_walk_time
+
+# 合成乐园的中心位置
+CENTER = (31.1445, 121.657)
+
+
+def make_synthetic_park(n_rides: int, seed: int = 0, open_time: int = 8, close_time: int = 24) -> ThemePark:
+    """
+    生成一个有 n_rides 个项目的合成乐园：坐标随机分布在中心附近的固定范围内（项目越多越密集，
+    步行时间不随规模增长），步行时间按球面距离估算（estimate_walk_time），逐小时排队时间为基础值加上一到两个高峰。
+    默认开到 24 点，项目关闭是硬约束，营业时间太短时大规模的请求会不可行。
+    """
+    rnd = random.Random(seed)
+    radius = 0.004  # 约 450 米
+    valid_rides = [f"Ride {i:03d}" for i in range(n_rides)]
+
+    osm_results = {}
+    history_results = {}
+    for ride in valid_rides:
+        osm_results[ride] = (CENTER[0] + rnd.uniform(-radius, radius), CENTER[1] + rnd.uniform(-radius, radius))
+        base = rnd.uniform(5, 20)
+        peaks = [(rnd.uniform(10, 17), rnd.uniform(1, 3), rnd.uniform(0, 90)) for _ in range(rnd.randint(1, 2))]
+        history = []
+        for hour in range(open_time, 24):
+            wait = base + sum(height * math.exp(-((hour - center) / width) ** 2 / 2)
+                              for center, width, height in peaks)
+            history.append([hour, float(round(wait + rnd.uniform(-2, 2)))])
+        history_results[ride] = history
+
+    walking_time = [[0.0] * n_rides for _ in range(n_rides)]
+    for i in range(n_rides):
+        for j in range(i + 1, n_rides):
+            walking_time[i][j] = walking_time[j][i] = estimate_walk_time(*osm_results[valid_rides[i]],
+                                                                         *osm_results[valid_rides[j]])
+
+    return ThemePark(park_id=0, park_name=f"Synthetic Park ({n_rides} rides)", valid_rides=valid_rides,
+                     osm_results=osm_results, history_results=history_results, walking_time=walking_time,
+                     open_time=open_time, close_time=close_time)
+
+
+def run_case(n_rides: int, seed: int, args) -> dict:
+    park = make_synthetic_park(n_rides, seed)
+    # 基准测的是 ACO，关掉小规模请求的自动精确求解
+    param_program = {"workers": args.workers, "pheromoneUpdate": args.pheromone_update, "exactMax": 0}
+    if args.max_time:
+        param_program["maxTime"] = args.max_time
+    if args.patience:
+        param_program["patience"] = args.patience
+    planner = Planner(park, param_program=param_program)
+
+    rnd = random.Random(seed)
+    visit = args.visit if args.visit_fraction is None else max(2, round(args.visit_fraction * n_rides))
+    visit = min(visit, n_rides - 1)
+    rides = rnd.sample(park.valid_rides, k=visit + 1)
+    current_pos = rides.pop()
+
+    with planner:
+        trace = ConvergenceTrace()
+        start = time.perf_counter()
+        try:
+            result = planner.solve(rides, args.start_time, current_pos, seed=seed, callback=trace,
+                                   time_budget=args.time_budget)
+        except ValueError:
+            return {"rides": n_rides, "visit": visit, "seed": seed, "feasible": False}
+        wall_time = time.perf_counter() - start
+
+        record = {
+            "rides": n_rides,
+            "visit": visit,
+            "seed": seed,
+            "feasible": True,
+            "workers": args.workers,
+            "wall_time": wall_time,
+            "iteration_time": wall_time / result.iterations,
+            "iterations": result.iterations,
+            "stop_reason": result.stop_reason,
+            "ants": result.ants,
+            "ants_per_second": result.ants / wall_time,
+            "evaluations": result.evaluations,
+            "evaluations_per_second": result.evaluations / wall_time,
+            "cache_hits": result.cache_hits,
+            "cache_misses": result.cache_misses,
+            "phase_times": trace.phase_totals(),
+            "total_time": result.total_time,
+            "route": result.route,
+        }
+        if args.trace:
+            record["trace"] = trace.as_dicts()
+
+        if not args.no_memory:
+            # 单独跑一遍来测内存，避免 tracemalloc 的开销影响计时
+            tracemalloc.start()
+            planner.solve(rides, args.start_time, current_pos, seed=seed, time_budget=args.time_budget)
+            record["peak_memory_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+
+    if visit <= args.exact_max:
+        optimum = planner.solve_exact(rides, args.start_time, current_pos).total_time
+        record["optimum"] = optimum
+        record["gap"] = (result.total_time - optimum) / optimum
+
+    return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ACO plan_route on synthetic parks.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 20, 50], help="number of rides in each park")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument("--visit", type=int, default=12,
+                        help="rides to visit per plan (capped at the park size minus the start)")
+    parser.add_argument("--visit-fraction", type=float, default=None,
+                        help="visit this fraction of each park's rides instead of a fixed --visit "
+                             "(at least 2; about 20 rides fit into one synthetic day)")
+    parser.add_argument("--start-time", default="9:30")
+    parser.add_argument("--max-time", type=int, default=None, help="override PARAM_PROGRAM['maxTime']")
+    parser.add_argument("--time-budget", type=float, default=None, help="wall-clock budget per plan in seconds")
+    parser.add_argument("--patience", type=int, default=None,
+                        help="stop after this many iterations without improvement")
+    parser.add_argument("--pheromone-update", choices=["all", "mmas"], default="all")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--exact-max", type=int, default=15,
+                        help="compare against the dynamic-programming optimum when visiting at most this many rides")
+    parser.add_argument("--trace", action="store_true", help="include the per-iteration convergence trace")
+    parser.add_argument("--no-memory", action="store_true", help="skip the extra run that measures peak memory")
+    parser.add_argument("--output", default=None, help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    results = []
+    for n_rides in args.sizes:
+        for seed in args.seeds:
+            record = run_case(n_rides, seed, args)
+            results.append(record)
+            if not record["feasible"]:
+                print(f"{n_rides} rides, seed {seed}: infeasible before closing", file=sys.stderr)
+                continue
+            gap = f", gap {record['gap']:.2%}" if "gap" in record else ""
+            print(f"{n_rides} rides, seed {seed}: {record['wall_time']:.2f} s, "
+                  f"{record['total_time']:.1f} min{gap}", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
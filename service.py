@@ -0,0 +1,268 @@
+"""
+常驻的路线规划服务：启动时加载乐园并预热进程池，之后持续接收规划请求，流式返回进度和结果。
+请求和响应都是 JSON lines，默认走 stdin / stdout，也可以监听本地 socket：
+
+    python service.py --park disney=parks/ShanghaiDisney.park --workers 4
+    python service.py --park disney=parks/ShanghaiDisney.json --socket /tmp/plan.sock
+    python service.py --park disney=parks/ShanghaiDisney.json --port 8765
+
+请求（只有 attractions 和 current_pos 是必需的；只加载了一个乐园时可以省略 park）:
+    {"id": 1, "park": "disney", "attractions": [...], "current_pos": "Fantasia Carousel", "start_time": "9:30",
+     "time_budget": 0.5, "seed": 0, "progress": true,
+     "windows": {"Roaring Rapids": ["13:00", "15:00"]},
+     "events": [{"name": "Lunch", "location": "Marvel Universe", "start": "12:00", "duration": 45, "latest": "12:30"}]}
+    {"id": 2, "type": "stats"}
+响应:
+    {"id": 1, "type": "progress", "iteration": 3, "best_length": 231.5, "route": [...]}  # 每次找到更好的路线
+    {"id": 1, "type": "result", "route": [...], "total_time": 222.5, "iterations": 40, "stop_reason": "timeBudget",
+     "latency": 0.41}
+    {"id": 1, "type": "error", "error": "Unknown attraction: ..."}
+
+time_budget（秒）从服务收到请求时开始计算，包括在队列中等待 worker 的时间。
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ACO_for_TDTSP import FixedEvent, IterationEvent, PheromoneStore, Planner
+from utils.ThemePark import load_park
+
+# 统计延迟时保留最近多少个请求
+LATENCY_WINDOW = 10000
+
+
+class PlanService:
+    """
+    管理各乐园的规划器和一个常驻进程池。每个 worker 在启动时收到全部规划器（从二进制文件加载的乐园只传路径），
+    之后每个请求只传请求本身；worker 中的进度事件经 multiprocessing.Queue 送回主进程，由 emit 写出。
+    """
+
+    def __init__(self, planners: dict[str, Planner], workers: int = 4, time_budget: float = 0.5):
+        self.planners = planners
+        self.workers = workers
+        self.time_budget = time_budget
+        self.progress = multiprocessing.Queue()
+        self.executor = None
+        self.latencies = []
+        self.served = 0
+        self.failed = 0
+        self.in_flight = 0
+        self._sinks = {}  # 请求的内部编号 -> 写出进度的函数
+        self._next_token = 0
+        self._loop = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self.executor = ProcessPoolExecutor(self.workers, initializer=_init_service_worker,
+                                            initargs=(self.planners, self.progress))
+        threading.Thread(target=self._forward_progress, daemon=True).start()
+        # 预热：让所有 worker 进程都启动并加载好规划器，第一个请求不用等进程启动
+        await asyncio.gather(*(self._loop.run_in_executor(self.executor, _warm_up, 0.05)
+                               for _ in range(self.workers)))
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        self.progress.put(None)
+
+    def _forward_progress(self):
+        # 后台线程：把 worker 发来的进度转交给事件循环
+        while True:
+            item = self.progress.get()
+            if item is None:
+                return
+            self._loop.call_soon_threadsafe(self._dispatch_progress, *item)
+
+    def _dispatch_progress(self, token: int, message: dict):
+        sink = self._sinks.get(token)
+        if sink is not None:
+            sink(message)
+
+    async def handle(self, request: dict, emit):
+        """处理一个请求，进度和结果（带上请求的 id）都通过 emit(dict) 写出"""
+        received = time.perf_counter()
+        request_id = request.get("id")
+
+        def reply(message: dict):
+            emit({"id": request_id, **message})
+
+        if request.get("type") == "stats":
+            reply({"type": "stats", **self.stats()})
+            return
+        token = self._next_token
+        self._next_token += 1
+        self.in_flight += 1
+        try:
+            park = request.get("park")
+            if park is None and len(self.planners) == 1:
+                park = next(iter(self.planners))
+            if park not in self.planners:
+                raise ValueError(f"Unknown park: {park}")
+            task = {"attractions": list(request["attractions"]), "current_pos": request["current_pos"],
+                    "start_time": request.get("start_time", "9:30"), "seed": request.get("seed"),
+                    "windows": request.get("windows"),
+                    "events": [FixedEvent(**event) for event in request.get("events") or []] or None}
+            budget = request.get("time_budget", self.time_budget)
+            deadline = time.time() + budget if budget is not None else None
+            if request.get("progress", True):
+                self._sinks[token] = lambda message: reply({"type": "progress", **message})
+            result = await self._loop.run_in_executor(self.executor, _plan_task, token, park, task, deadline,
+                                                      token in self._sinks)
+        except Exception as e:
+            self.failed += 1
+            reply({"type": "error", "error": f"Missing field: {e}" if isinstance(e, KeyError) else str(e)})
+            return
+        finally:
+            self.in_flight -= 1
+            self._sinks.pop(token, None)
+
+        latency = time.perf_counter() - received
+        self.served += 1
+        self.latencies.append(latency)
+        del self.latencies[:-LATENCY_WINDOW]
+        reply({"type": "result", **result, "latency": latency})
+
+    def stats(self) -> dict:
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+        return {"served": self.served, "failed": self.failed, "in_flight": self.in_flight,
+                "p50": float(np.percentile(latencies, 50)), "p99": float(np.percentile(latencies, 99))}
+
+    async def serve_lines(self, readline, emit):
+        """
+        从 readline（返回一行 bytes / str 的协程函数，结束时返回空）逐行读取请求，每个请求并发处理；
+        输入结束后等所有请求处理完再返回。
+        """
+        tasks = set()
+        while True:
+            line = await readline()
+            if not line:
+                break
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                emit({"id": None, "type": "error", "error": f"Invalid JSON: {e}"})
+                continue
+            task = asyncio.create_task(self.handle(request, emit))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+
+def _write_line(stream, message: dict):
+    stream.write(json.dumps(message, ensure_ascii=False) + "\n")
+    stream.flush()
+
+
+async def serve_stdio(service: PlanService):
+    loop = asyncio.get_running_loop()
+    # stdin 可能是普通文件，用线程读取而不是 connect_read_pipe
+    await service.serve_lines(lambda: loop.run_in_executor(None, sys.stdin.readline),
+                              lambda message: _write_line(sys.stdout, message))
+
+
+async def serve_socket(service: PlanService, path: str = None, port: int = None):
+    async def on_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        def emit(message: dict):
+            if not writer.is_closing():
+                writer.write((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+
+        try:
+            await service.serve_lines(reader.readline, emit)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    if path is not None:
+        server = await asyncio.start_unix_server(on_connection, path)
+    else:
+        server = await asyncio.start_server(on_connection, "127.0.0.1", port)
+    print(f"Listening on {path or f'127.0.0.1:{port}'}", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+# ---------------- worker processes ----------------
+_SERVICE_PLANNERS = None
+_PROGRESS = None
+
+
+def _init_service_worker(planners: dict[str, Planner], progress):
+    global _SERVICE_PLANNERS, _PROGRESS
+    for planner in planners.values():
+        planner._executor = None
+        planner.param_program = {**planner.param_program, "workers": 1}
+    _SERVICE_PLANNERS = planners
+    _PROGRESS = progress
+
+
+def _warm_up(seconds: float):
+    # 占住 worker 一小段时间，保证预热任务分到不同的进程
+    time.sleep(seconds)
+
+
+def _plan_task(token: int, park: str, task: dict, deadline: float | None, progress: bool) -> dict:
+    planner = _SERVICE_PLANNERS[park]
+
+    def report(event: IterationEvent):
+        if event.improved:
+            _PROGRESS.put((token, {"iteration": event.iteration, "best_length": event.best_length,
+                                   "route": event.best_route}))
+
+    callback = report if progress else None
+    # 剩下的预算（已经超时也至少跑一次迭代）
+    budget = max(deadline - time.time(), 0.0) if deadline is not None else None
+    result = planner.solve(task["attractions"], task["start_time"], task["current_pos"], seed=task["seed"],
+                           callback=callback, time_budget=budget, windows=task["windows"], events=task["events"])
+    return {"route": result.route, "total_time": result.total_time, "iterations": result.iterations,
+            "stop_reason": result.stop_reason}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Long-running route planning service (JSON lines).")
+    parser.add_argument("--park", action="append", required=True, metavar="NAME=PATH",
+                        help="park to load (.json or compiled binary); repeat for several parks. "
+                             "NAME defaults to the file name without extension")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--time-budget", type=float, default=0.5,
+                        help="default per-request budget in seconds, counted from arrival")
+    parser.add_argument("--warm-start", action="store_true",
+                        help="give every planner a PheromoneStore (kept per worker process)")
+    parser.add_argument("--socket", default=None, help="listen on this unix socket instead of stdin / stdout")
+    parser.add_argument("--port", type=int, default=None, help="listen on this localhost TCP port")
+    args = parser.parse_args(argv)
+
+    planners = {}
+    for spec in args.park:
+        name, _, path = spec.rpartition("=")
+        name = name or os.path.splitext(os.path.basename(path))[0]
+        planners[name] = Planner(load_park(path), pheromone_store=PheromoneStore() if args.warm_start else None)
+
+    async def run():
+        service = PlanService(planners, workers=args.workers, time_budget=args.time_budget)
+        await service.start()
+        try:
+            if args.socket is not None or args.port is not None:
+                await serve_socket(service, args.socket, args.port)
+            else:
+                await serve_stdio(service)
+        finally:
+            service.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import itertools
+import json
+import os
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from ACO_for_TDTSP import PARAM_ANT, FixedEvent, PheromoneStore, PlanState, Planner
+from utils.ThemePark import ThemePark
+from utils.WaitModel import Calendar, WaitModel
+
+PARK_FILE = os.path.join(os.path.dirname(__file__), os.pardir, "parks", "ShanghaiDisney.json")
+
+
+@pytest.fixture(scope="module")
+def park():
+    with open(PARK_FILE, "r", encoding="utf-8") as f:
+        return ThemePark(**json.load(f))
+
+
+def sample_request(park, k, seed=0):
+    rides = random.Random(seed).sample(park.valid_rides, k=k + 1)
+    return rides, rides.pop()
+
+
+def test_mmas_warm_start_twice(park):
+    # 热启动的初始路线作为 MMAS 的全局最好路线时没有 LR，不能更新 LF
+    planner = Planner(park, param_program={"exactMax": 0, "pheromoneUpdate": "mmas"},
+                      pheromone_store=PheromoneStore())
+    rides, current_pos = sample_request(park, 6)
+    first = planner.solve(rides, "9:30", current_pos, seed=0)
+    second = planner.solve(rides, "9:30", current_pos, seed=1)
+    assert second.warm_start
+    assert second.total_time <= first.total_time + 1e-9
+
+
+def test_mmas_replan_keeps_seeded_route(park):
+    # 只有随机蚂蚁，从最优路线重新规划时一直比不过初始路线，MMAS 的全局最好路线就是它
+    param_ant = {(stage, "random"): {"count": 20} for stage in ("main", "stagnate", "final")}
+    planner = Planner(park, param_program={"exactMax": 0, "pheromoneUpdate": "mmas"}, param_ant=param_ant)
+    rides, current_pos = sample_request(park, 6)
+    previous = planner.solve_exact(rides, "9:30", current_pos)
+    result = planner.replan(previous, previous.start_minute, current_pos, iterations=10, seed=0)
+    assert result.route == previous.route
+    assert result.total_time == previous.total_time
+
+
+def test_replan_keeps_plan_date(park):
+    planner = Planner(park, wait_model=WaitModel(park, calendar=Calendar(holidays={date(2026, 12, 25)})))
+    rides, current_pos = sample_request(park, 6)
+    previous = planner.solve(rides, datetime(2026, 12, 25, 9, 30), current_pos)
+    result = planner.replan(previous, "10:30", previous.route[0])
+    assert result.day == date(2026, 12, 25)
+    assert result.start_minute == 150
+
+
+@pytest.mark.parametrize("pheromone_update, candidates, k, seed, start_time",
+                         [("mmas", None, 20, 5, "9:00"), ("all", 5, 20, 5, "9:00"), ("all", 5, 16, 1, "13:00")])
+def test_infeasible_request_raises(park, pheromone_update, candidates, k, seed, start_time):
+    # 关闭前玩不完的请求：MMAS 没有全局最好路线、候选列表模式下蚂蚁的时刻为 inf 时都应抛出 ValueError
+    param_ant = {key: {**params, "candidates": candidates} if candidates and "LR" in params else params
+                 for key, params in PARAM_ANT.items()}
+    planner = Planner(park, param_program={"exactMax": 0, "maxTime": 20, "pheromoneUpdate": pheromone_update},
+                      param_ant=param_ant)
+    rides, current_pos = sample_request(park, k, seed)
+    with pytest.raises(ValueError):
+        planner.solve(rides, start_time, current_pos, seed=0)
+
+
+@pytest.mark.parametrize("case", [0, 1, 25, 28, 41, 64])
+def test_exact_solver_with_windows_matches_brute_force(park, case):
+    # 窗口开始前到达时按连续的到达时刻等待，动态规划仍然满足 FIFO
+    rnd = random.Random(case)
+    rides = rnd.sample(park.valid_rides, k=7)
+    current_pos = rides.pop()
+    windows = {}
+    for ride in rnd.sample(rides, 2):
+        earliest = rnd.uniform(100, 250)
+        windows[ride] = (earliest, earliest + rnd.uniform(20, 120))
+    events = [FixedEvent("Show", rides[0], rnd.uniform(120, 200), 20)]
+    planner = Planner(park)
+    state = PlanState(planner, rides, 90.0 + rnd.random(), current_pos, 0, windows=windows, events=events)
+    lengths = planner.evaluate_routes(state, list(itertools.permutations(range(len(state.attractions_to_visit)))))
+    assert planner.held_karp(state)[1] == pytest.approx(lengths.min(), abs=1e-9)
+
+
+def test_event_starts_by_its_latest_time(park):
+    # 最晚时刻按连续的到达时刻检查，不能晚到不足一分钟
+    rnd = random.Random(12)
+    rides = rnd.sample(park.valid_rides, k=7)
+    current_pos = rides.pop()
+    lunch = FixedEvent("Lunch", rnd.choice(rides), "12:00", 45, latest="12:30")
+    result = Planner(park).solve(rides, "9:30", current_pos, events=[lunch])
+    start = result.schedule[result.route.index("Lunch")] - timedelta(minutes=45)
+    assert start <= start.replace(hour=12, minute=30, second=0, microsecond=0)
+
+
+def test_replan_from_an_event(park):
+    rides, current_pos = sample_request(park, 6)
+    lunch = FixedEvent("Lunch", rides[0], "12:00", 45, latest="12:30")
+    planner = Planner(park)
+    previous = planner.solve(rides, "9:30", current_pos, events=[lunch])
+    remaining = previous.route[previous.route.index("Lunch") + 1:]
+    result = planner.replan(previous, "12:45", "Lunch", remaining=remaining)
+    assert result.start_pos == rides[0]
+    assert sorted(result.route) == sorted(remaining)
@@ -0,0 +1,86 @@
+import json
+import mmap
+import struct
+from dataclasses import dataclass
+
+import numpy as np
+
+
+# 文件头: 魔数、版本号、JSON 头的字节数；之后是 JSON 头和按 ALIGN 字节对齐的各个数组
+MAGIC = b"TDTSPARK"
+VERSION = 1
+PREFIX = struct.Struct("<8sIQ")
+ALIGN = 64
+ARRAYS = ("walking_time", "wait_profile", "coordinates")
+
+
+def _aligned(offset: int):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+@dataclass
+class CompiledPark:
+    """
+    规划器需要的乐园数据的紧凑形式：项目名称表、步行时间矩阵 walking_time[i, j]、
+    按分钟预编译的排队时间表 wait_profile[i, minute]（见 ThemePark.compile_wait_profile）和坐标。
+    可以保存为二进制文件并用 mmap 只读加载，多个进程加载同一个文件时共享同一份物理内存；
+    从文件加载的对象在 pickle 时只传文件路径，进程池中的 worker 会重新映射同一个文件。
+    与 ThemePark 字段同名，可以直接传给 Planner。JSON (ThemePark) 仍然是交换格式。
+    """
+    park_id: int
+    park_name: str
+    valid_rides: list[str]
+    open_time: int
+    close_time: int
+    walking_time: np.ndarray
+    wait_profile: np.ndarray
+    coordinates: np.ndarray
+    path: str | None = None
+
+    def compile_wait_profile(self, day=None) -> np.ndarray:
+        # 文件中只保存了编译好的 all time 排队时间表，按日历选择 profile 需要用 ThemePark 和 WaitModel
+        if day is not None:
+            raise ValueError("A CompiledPark only has the all-time wait profile; use a ThemePark for per-day profiles")
+        return self.wait_profile
+
+    def save(self, path: str):
+        header = {"park_id": self.park_id, "park_name": self.park_name, "valid_rides": self.valid_rides,
+                  "open_time": self.open_time, "close_time": self.close_time, "arrays": {}}
+        arrays = {name: np.ascontiguousarray(getattr(self, name), dtype=np.float64) for name in ARRAYS}
+        # 先确定 JSON 头的长度，再计算各数组的偏移
+        offset = 0
+        for name, array in arrays.items():
+            header["arrays"][name] = {"offset": offset, "shape": list(array.shape), "dtype": array.dtype.str}
+            offset = _aligned(offset + array.nbytes)
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        data_start = _aligned(PREFIX.size + len(header_bytes))
+
+        with open(path, "wb") as f:
+            f.write(PREFIX.pack(MAGIC, VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            for name, array in arrays.items():
+                f.seek(data_start + header["arrays"][name]["offset"])
+                f.write(array.tobytes())
+            f.truncate(data_start + offset)
+
+    @classmethod
+    def load(cls, path: str):
+        """用 mmap 只读加载 save 保存的文件，数组直接指向映射的页面，不做拷贝"""
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_size = PREFIX.unpack_from(buffer)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a compiled park file (version {VERSION}): {path}")
+        header = json.loads(bytes(buffer[PREFIX.size:PREFIX.size + header_size]).decode("utf-8"))
+        data_start = _aligned(PREFIX.size + header_size)
+
+        arrays = {}
+        for name, spec in header.pop("arrays").items():
+            arrays[name] = np.frombuffer(buffer, dtype=np.dtype(spec["dtype"]), count=int(np.prod(spec["shape"])),
+                                         offset=data_start + spec["offset"]).reshape(spec["shape"])
+        return cls(**header, **arrays, path=path)
+
+    def __reduce_ex__(self, protocol):
+        if self.path is not None:
+            return self.__class__.load, (self.path,)
+        return super().__reduce_ex__(protocol)
@@ -1,19 +1,106 @@
+import asyncio
 import requests
 from bs4 import BeautifulSoup
 import re
 import time
+from requests.adapters import HTTPAdapter
+
+
+# 需要重试的 HTTP 状态码：限流和服务端错误
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def parse_coordinates(soup):
+    """从设施详情页解析 OSM 坐标 (lat, lon)，找不到时返回 None"""
+    # 用正则提取 lat,lon 格式
+    match = re.search(r"Coordinates \(OSM\)\s*([\d\.\-]+),\s*([\d\.\-]+)", soup.text)
+    if not match:
+        return None
+    return float(match.group(1)), float(match.group(2))
+
+
+def parse_hourly_history(soup):
+    """
+    从设施详情页解析 Average queue time by hour (all time) 表格，
+    返回 [[hour, avg_wait], ...]，找不到表格时返回 None
+    """
+    target_header = None
+    for h in soup.find_all(["h2", "h3"]):
+        if "Average queue time by hour" in h.get_text():
+            target_header = h
+            break
+    if not target_header:
+        return None
+
+    table = target_header.find_next("table")
+    if not table:
+        return None
+
+    hourly_data = []
+    rows = table.find_all("tr")[1:]  # 跳过表头
+    for row in rows:
+        cols = [c.get_text(strip=True) for c in row.find_all("td")]
+        if len(cols) >= 2:
+            try:
+                hour = int(cols[0])
+                avg_wait = float(cols[1].replace("mins", "").strip())
+            except ValueError:
+                continue
+            hourly_data.append([hour, avg_wait])
+    return hourly_data
+
+
+class TokenBucket:
+    """令牌桶限速：平均每秒 rate 个请求，最多连续发出 burst 个"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
 
 
 class QueueTimesScraper:
-    def __init__(self):
-        self.base_url = "https://queue-times.com"
+    def __init__(self, base_url: str = "https://queue-times.com", rate: float = 2.0, burst: int = 2,
+                 concurrency: int = 4, retries: int = 3, backoff: float = 1.0, timeout: float = 10):
+        """
+        rate / burst: 抓取详情页的令牌桶限速（每秒请求数 / 突发数）；concurrency: 同时进行的请求数上限；
+        retries / backoff: 网络错误、429 和 5xx 时最多重试的次数，以及指数退避的初始等待秒数。
+        base_url 可以指向本地的测试服务器。
+        """
+        self.base_url = base_url.rstrip("/")
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
         }
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        # 所有请求共用一个带连接池的 session
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(concurrency, 1))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
     def get_park_id(self, park_name):
         """获取乐园 ID"""
-        res = requests.get(f"{self.base_url}/parks.json", headers=self.headers)
+        res = self.session.get(f"{self.base_url}/parks.json", timeout=self.timeout)
         for group in res.json():
             for park in group['parks']:
                 if park_name.lower() in park['name'].lower():
@@ -23,7 +110,7 @@ class QueueTimesScraper:
     def get_ride_list(self, park_id):
         """获取乐园内所有设施的名称和 ID 映射"""
         url = f"{self.base_url}/parks/{park_id}/queue_times.json"
-        data = requests.get(url, headers=self.headers).json()
+        data = self.session.get(url, timeout=self.timeout).json()
         ride_map = {}
         for land in data.get('lands', []):
             for ride in land.get('rides', []):
@@ -38,19 +125,11 @@ class QueueTimesScraper:
         url = f"{self.base_url}/parks/{park_id}/rides/{ride_id}"
         print(f"  -> 正在抓取详情页: {url}")
 
-        res = requests.get(url, headers=self.headers, timeout=10)
-        soup = BeautifulSoup(res.text, 'html.parser')
-
-        text = soup.text
-        # 用正则提取 lat,lon 格式
-        match = re.search(r"Coordinates \(OSM\)\s*([\d\.\-]+),\s*([\d\.\-]+)", text)
-        if match:
-            lat, lon = float(match.group(1)), float(match.group(2))
-        else:
+        res = self.session.get(url, timeout=self.timeout)
+        coordinates = parse_coordinates(BeautifulSoup(res.text, 'html.parser'))
+        if coordinates is None:
             print("坐标提取失败")
-            return None
-
-        return lat, lon
+        return coordinates
 
     def get_hourly_history(self, park_id, target_rides_map):
         """
@@ -60,6 +139,7 @@ class QueueTimesScraper:
         {
             ride_name: [[hour, avg_wait], ...]
         }
+        同时需要坐标时用 scrape_rides，每个详情页只下载一次。
         """
         results = {}
 
@@ -69,40 +149,11 @@ class QueueTimesScraper:
             print(f"  -> 正在抓取逐小时数据: {url}")
 
             try:
-                res = requests.get(url, headers=self.headers, timeout=10)
-                soup = BeautifulSoup(res.text, "html.parser")
-
-                hourly_data = []
-
-                headers = soup.find_all(["h2", "h3"])
-                target_header = None
-                for h in headers:
-                    if "Average queue time by hour" in h.get_text():
-                        target_header = h
-                        break
-
-                if not target_header:
-                    print(f"     未找到逐小时表格标题: {ride_name}")
-                    results[ride_name] = []
-                    continue
-
-                table = target_header.find_next("table")
-                if not table:
+                res = self.session.get(url, timeout=self.timeout)
+                hourly_data = parse_hourly_history(BeautifulSoup(res.text, "html.parser"))
+                if hourly_data is None:
                     print(f"     未找到逐小时表格: {ride_name}")
-                    results[ride_name] = []
-                    continue
-
-                rows = table.find_all("tr")[1:]  # 跳过表头
-                for row in rows:
-                    cols = [c.get_text(strip=True) for c in row.find_all("td")]
-                    if len(cols) >= 2:
-                        hour = int(cols[0])
-                        avg_wait = cols[1].replace("mins", "").strip()
-                        try:
-                            hourly_data.append([hour, float(avg_wait)])
-                        except ValueError:
-                            continue
-
+                    hourly_data = []
                 results[ride_name] = hourly_data
 
                 time.sleep(1)  # 礼貌延迟
@@ -113,6 +164,64 @@ class QueueTimesScraper:
 
         return results
 
+    # ---------------- 并发抓取 ----------------
+    async def fetch_ride_page(self, park_id, ride_id, bucket: TokenBucket, semaphore: asyncio.Semaphore):
+        """下载一个设施详情页，限速并在失败时指数退避重试；最终失败抛出 requests.RequestException"""
+        url = f"{self.base_url}/parks/{park_id}/rides/{ride_id}"
+        for attempt in range(self.retries + 1):
+            await bucket.acquire()
+            async with semaphore:
+                try:
+                    res = await asyncio.to_thread(self.session.get, url, timeout=self.timeout)
+                    if res.status_code not in RETRY_STATUS:
+                        res.raise_for_status()
+                        return res.text
+                    error = requests.HTTPError(f"{res.status_code} for url: {url}", response=res)
+                except requests.HTTPError:
+                    raise  # 404 等不需要重试
+                except requests.RequestException as e:
+                    res, error = None, e
+            if attempt == self.retries:
+                raise error
+            delay = self.backoff * 2 ** attempt
+            if res is not None and res.headers.get("Retry-After", "").isdigit():
+                delay = max(delay, int(res.headers["Retry-After"]))
+            print(f"  -> {url} 请求失败 ({error})，{delay:g} 秒后重试")
+            await asyncio.sleep(delay)
+
+    async def scrape_rides_async(self, park_id, target_rides_map):
+        """并发抓取各设施详情页，每页只下载一次，同时解析坐标和逐小时排队时间"""
+        bucket = TokenBucket(self.rate, self.burst)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def scrape(ride_name, ride_id):
+            try:
+                text = await self.fetch_ride_page(park_id, ride_id, bucket, semaphore)
+            except requests.RequestException as e:
+                print(f"     抓取失败 {ride_name}: {e}")
+                return None, []
+            soup = BeautifulSoup(text, "html.parser")
+            coordinates = parse_coordinates(soup)
+            hourly_data = parse_hourly_history(soup)
+            if coordinates is None:
+                print(f"     坐标提取失败: {ride_name}")
+            if hourly_data is None:
+                print(f"     未找到逐小时表格: {ride_name}")
+            return coordinates, hourly_data or []
+
+        names = list(target_rides_map)
+        pages = await asyncio.gather(*(scrape(name, target_rides_map[name]) for name in names))
+        osm_results = {name: page[0] for name, page in zip(names, pages)}
+        history_results = {name: page[1] for name, page in zip(names, pages)}
+        return osm_results, history_results
+
+    def scrape_rides(self, park_id, target_rides_map):
+        """
+        scrape_rides_async 的同步版本，返回 (osm_results, history_results)：
+        {ride_name: (lat, lon) 或 None}，{ride_name: [[hour, avg_wait], ...]}
+        """
+        return asyncio.run(self.scrape_rides_async(park_id, target_rides_map))
+
 
 # --- 执行主程序 ---
 if __name__ == "__main__":
@@ -134,14 +243,8 @@ if __name__ == "__main__":
         # 筛选出用户指定的项目
         final_targets = {name: all_rides[name] for name in target_ride_names if name in all_rides}
 
-        # 4. 抓取 OSM 和 历史时间
-        osm_results = {}
-        for name, r_id in final_targets.items():
-            print(f"正在处理项目: {name}")
-            osm_results[name] = scraper.scrape_osm_info(park_id, r_id)
-            time.sleep(1)  # 礼貌抓取，避免频率过高
-
-        history_results = scraper.get_hourly_history(park_id, final_targets)
+        # 4. 抓取 OSM 和 历史时间（每个详情页只下载一次）
+        osm_results, history_results = scraper.scrape_rides(park_id, final_targets)
 
         # 5. 打印结果
         print("\n" + "=" * 50)
@@ -1,12 +1,37 @@
-import time
+import json
+import math
+import os
+import numpy as np
 import requests
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass, field
+from datetime import date
+from utils.CompiledPark import CompiledPark
 from utils.Scraper import QueueTimesScraper
+from utils.WaitModel import WaitModel
 
+OSRM_BASE_URL = "https://router.project-osrm.org"
+# 每次 /table 请求最多的出发点 / 目的地数，公共 OSRM 服务限制一次最多 100 个坐标
+OSRM_TABLE_CHUNK = 50
+# OSRM 不可用时按球面距离估算步行时间：步行速度（米 / 分钟）和道路绕行系数
+WALK_SPEED = 80
+DETOUR = 1.3
 
-def get_walk_time_osrm(lat1, lon1, lat2, lon2):
+
+def haversine(lat1, lon1, lat2, lon2):
+    # 球面距离，单位：米
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371000 * math.asin(math.sqrt(a))
+
+
+def estimate_walk_time(lat1, lon1, lat2, lon2):
+    # 离线估算的步行时间，单位：分钟
+    return haversine(lat1, lon1, lat2, lon2) * DETOUR / WALK_SPEED
+
+
+def get_walk_time_osrm(lat1, lon1, lat2, lon2, base_url: str = OSRM_BASE_URL):
     url = (
-        f"https://router.project-osrm.org/route/v1/foot/"
+        f"{base_url}/route/v1/foot/"
         f"{lon1},{lat1};{lon2},{lat2}"
         f"?overview=false"
     )
@@ -20,6 +45,54 @@ def get_walk_time_osrm(lat1, lon1, lat2, lon2):
     return duration_seconds / 60  # 转为分钟
 
 
+def get_walk_time_table_osrm(sources: list[tuple[float, float]], destinations: list[tuple[float, float]],
+                             base_url: str = OSRM_BASE_URL, session: requests.Session | None = None):
+    """
+    一次 OSRM /table 请求得到 sources × destinations 的步行时间矩阵（分钟），坐标为 (lat, lon)。
+    无法到达的点对为 None。
+    """
+    coordinates = ";".join(f"{lon},{lat}" for lat, lon in sources + destinations)
+    url = (
+        f"{base_url}/table/v1/foot/{coordinates}"
+        f"?sources={';'.join(map(str, range(len(sources))))}"
+        f"&destinations={';'.join(map(str, range(len(sources), len(sources) + len(destinations))))}"
+        f"&annotations=duration"
+    )
+    r = (session or requests).get(url, timeout=30)
+    data = r.json()
+
+    if data["code"] != "Ok":
+        raise Exception(f"Routing failed: {data.get('message', data['code'])}")
+
+    return [[None if d is None else d / 60 for d in row] for row in data["durations"]]
+
+
+class WalkingTimeCache:
+    """按坐标缓存的两点间步行时间（分钟），保存为 JSON 文件；path 为 None 时只在内存中缓存。"""
+
+    def __init__(self, path: str | None = None):
+        self.path = path
+        self.durations = {}
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.durations = json.load(f)
+
+    @staticmethod
+    def key(source, destination):
+        return f"{source[0]:.6f},{source[1]:.6f};{destination[0]:.6f},{destination[1]:.6f}"
+
+    def get(self, source, destination):
+        return self.durations.get(self.key(source, destination))
+
+    def put(self, source, destination, minutes):
+        self.durations[self.key(source, destination)] = minutes
+
+    def save(self):
+        if self.path:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self.durations, f, indent=0)
+
+
 @dataclass
 class ThemePark:
     park_id: int
@@ -30,11 +103,17 @@ class ThemePark:
     walking_time: list[list[float]]
     open_time: int
     close_time: int
+    # 按日历 profile（如 "weekend"、"holiday"、"summer"）分开的历史排队时间 {profile: {ride: [[hour, wait], ...]}}，
+    # 见 utils.WaitModel；history_results 为 "all"
+    profile_history: dict = field(default_factory=dict)
 
     @classmethod
     def from_scraper(cls, park_name: str, ride_name_list: list[str] | None = None,
-                     open_time: int=8, close_time: int=20):
-        scraper = QueueTimesScraper()
+                     open_time: int=8, close_time: int=20, scraper: QueueTimesScraper | None = None,
+                     osrm_base_url: str = OSRM_BASE_URL, walk_cache_path: str | None = None):
+        # scraper 可以传入自定义限速 / 并发 / base_url 的 QueueTimesScraper；
+        # osrm_base_url 可以指向本地的 OSRM，walk_cache_path 为步行时间缓存文件
+        scraper = scraper or QueueTimesScraper()
         park_id, full_park_name = scraper.get_park_id(park_name)
 
         if not park_id:
@@ -48,13 +127,9 @@ class ThemePark:
         else:
             final_targets = all_rides
 
-        osm_results = {}
-        for name, r_id in final_targets.items():
-            print(f"\n正在处理项目: {name}")
-            osm_results[name] = scraper.scrape_osm_info(park_id, r_id)
-            time.sleep(1)
-
-        history_results = scraper.get_hourly_history(park_id, final_targets)
+        # 并发抓取详情页，每页只下载一次
+        print(f"正在抓取 {len(final_targets)} 个项目的详情页")
+        osm_results, history_results = scraper.scrape_rides(park_id, final_targets)
 
         # 只有信息完整的项目才是有效的
         valid_rides = [
@@ -65,7 +140,7 @@ class ThemePark:
         osm_results = {r: osm_results[r] for r in valid_rides}
         history_results = {r: history_results[r] for r in valid_rides}
 
-        walking_time = cls._compute_walking_time(valid_rides, osm_results)
+        walking_time = cls._compute_walking_time(valid_rides, osm_results, osrm_base_url, walk_cache_path)
 
         return cls(
             park_id=park_id,
@@ -78,28 +153,185 @@ class ThemePark:
             close_time=close_time
         )
 
+    @classmethod
+    def from_json(cls, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(**json.load(f))
+
+    def to_json(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f, ensure_ascii=False, indent=2)
+
+    def compile(self) -> CompiledPark:
+        # 编译为规划器使用的数组形式，可以 save 成二进制文件
+        return CompiledPark(
+            park_id=self.park_id,
+            park_name=self.park_name,
+            valid_rides=list(self.valid_rides),
+            open_time=self.open_time,
+            close_time=self.close_time,
+            walking_time=np.asarray(self.walking_time, dtype=np.float64).reshape(len(self.valid_rides), -1),
+            wait_profile=np.asarray(self.compile_wait_profile(), dtype=np.float64),
+            coordinates=np.array([self.osm_results[r] for r in self.valid_rides], dtype=np.float64).reshape(-1, 2)
+        )
+
+    def to_binary(self, path: str):
+        self.compile().save(path)
+
+    def refresh(self, history: bool = True, coordinates: bool = False, ride_name_list: list[str] | None = None,
+                scraper: QueueTimesScraper | None = None, osrm_base_url: str = OSRM_BASE_URL,
+                walk_cache_path: str | None = None):
+        """
+        增量更新乐园数据，返回新的 ThemePark。先用 get_ride_list 取当前的项目列表与 valid_rides 比较：
+        已下线的项目被删除，新项目（限定在 ride_name_list 内）抓取坐标和历史排队时间；
+        history / coordinates 控制是否重新抓取已有项目的历史排队时间 / 坐标，两者可以按不同频率更新。
+        walking_time 只为新项目和坐标变化的项目重新计算对应的行和列，其余照搬。
+        已有项目重新抓取失败时保留原来的数据。
+        """
+        scraper = scraper or QueueTimesScraper()
+        live_rides = scraper.get_ride_list(self.park_id)
+        wanted = ride_name_list or list(live_rides)
+
+        kept = [r for r in self.valid_rides if r in live_rides]
+        removed = [r for r in self.valid_rides if r not in live_rides]
+        new = [r for r in wanted if r in live_rides and r not in self.valid_rides]
+        to_scrape = new + (kept if history or coordinates else [])
+        print(f"{self.park_name}: 新增 {len(new)} 个项目，下线 {len(removed)} 个，抓取 {len(to_scrape)} 个详情页")
+        osm_results, history_results = scraper.scrape_rides(self.park_id, {r: live_rides[r] for r in to_scrape})
+
+        valid_rides = kept + [r for r in new if osm_results[r] and history_results[r]]
+        new_osm, new_history = {}, {}
+        for r in valid_rides:
+            if r in self.osm_results and not (coordinates and osm_results.get(r)):
+                new_osm[r] = self.osm_results[r]
+            else:
+                new_osm[r] = osm_results[r]
+            if r in self.history_results and not (history and history_results.get(r)):
+                new_history[r] = self.history_results[r]
+            else:
+                new_history[r] = history_results[r]
+
+        # 原矩阵按坐标放进缓存，坐标没变的点对直接复用，只请求新项目 / 坐标变化的项目所在的行和列
+        cache = WalkingTimeCache(walk_cache_path)
+        index = {r: i for i, r in enumerate(self.valid_rides)}
+        for a in kept:
+            for b in kept:
+                if a != b:
+                    cache.put(tuple(self.osm_results[a]), tuple(self.osm_results[b]),
+                              self.walking_time[index[a]][index[b]])
+        walking_time = self._compute_walking_time(valid_rides, new_osm, osrm_base_url, cache)
+
+        return ThemePark(
+            park_id=self.park_id,
+            park_name=self.park_name,
+            valid_rides=valid_rides,
+            osm_results=new_osm,
+            history_results=new_history,
+            walking_time=walking_time,
+            open_time=self.open_time,
+            close_time=self.close_time,
+            profile_history={profile: {r: h for r, h in rides.items() if r in valid_rides}
+                             for profile, rides in self.profile_history.items()}
+        )
+
+    def compile_wait_profile(self, day: date | None = None) -> np.ndarray:
+        """
+        把历史排队时间编译成按分钟索引的查找表 profile[ride_id, minute]，ride_id 为 valid_rides 中的下标，
+        minute 为距开园 (open_time) 的整分钟数，覆盖到当天 24:00，末尾附加一个关闭 (inf) 的哨兵列，
+        越界的分钟数应截断到该位置。day 为 None 时用 all time 平均，否则按日历选择 profile，见 WaitModel。
+        """
+        return WaitModel(self).compile(day)
+
     @staticmethod
-    def _compute_walking_time(valid_rides, osm_results):
+    def _compute_walking_time(valid_rides, osm_results, base_url: str = OSRM_BASE_URL,
+                              cache: "str | WalkingTimeCache | None" = None, chunk: int = OSRM_TABLE_CHUNK,
+                              fallback: bool = True):
+        """
+        用 OSRM /table 批量计算步行时间矩阵，matrix[i][j] 为从 valid_rides[i] 走到 valid_rides[j] 的分钟数。
+        cache 为缓存文件路径或 WalkingTimeCache，缓存里已有的点对不再请求，新增一个项目时只需要请求它所在的行和列；
+        出发点 / 目的地较多时按 chunk 分块请求。请求失败且 fallback 为真时按球面距离估算（不写入缓存）。
+        """
         n = len(valid_rides)
+        coords = [tuple(osm_results[r]) for r in valid_rides]
+        if not isinstance(cache, WalkingTimeCache):
+            cache = WalkingTimeCache(cache)
         matrix = [[0.0] * n for _ in range(n)]
+
+        # 按缺少的目的地给出发点分组：缺大半行的出发点直接请求整行（对角线的结果忽略），
+        # 其余出发点按缺少的目的地集合分组。新增一个项目时就是它所在的整行加上其余出发点的那一列
+        everything = tuple(range(n))
+        groups = {}
         for i in range(n):
-            for j in range(i + 1, n):
-                lat1, lon1 = osm_results[valid_rides[i]]
-                lat2, lon2 = osm_results[valid_rides[j]]
-                t = get_walk_time_osrm(lat1, lon1, lat2, lon2)
-                matrix[i][j] = matrix[j][i] = t
-                print(f"{valid_rides[i]} -> {valid_rides[j]}: {t} min")
+            missing = []
+            for j in range(n):
+                if i == j:
+                    continue
+                t = cache.get(coords[i], coords[j])
+                if t is None:
+                    missing.append(j)
+                else:
+                    matrix[i][j] = t
+            if len(missing) > (n - 1) / 2:
+                groups.setdefault(everything, []).append(i)
+            elif missing:
+                groups.setdefault(tuple(missing), []).append(i)
+
+        session = requests.Session()
+        requested = 0
+        for destinations, sources in groups.items():
+            for s in range(0, len(sources), chunk):
+                for d in range(0, len(destinations), chunk):
+                    src, dst = sources[s:s + chunk], destinations[d:d + chunk]
+                    try:
+                        table = get_walk_time_table_osrm([coords[i] for i in src], [coords[j] for j in dst],
+                                                         base_url, session)
+                        requested += 1
+                    except Exception as e:
+                        if not fallback:
+                            raise
+                        print(f"OSRM 请求失败 ({e})，按球面距离估算 {len(src)} x {len(dst)} 个点对")
+                        table = [[None] * len(dst) for _ in src]
+                    for a, i in enumerate(src):
+                        for b, j in enumerate(dst):
+                            if i == j:
+                                continue
+                            t = table[a][b]
+                            if t is None:
+                                if not fallback:
+                                    raise Exception(f"Routing failed: {valid_rides[i]} -> {valid_rides[j]}")
+                                t = estimate_walk_time(*coords[i], *coords[j])
+                            else:
+                                cache.put(coords[i], coords[j], t)
+                            matrix[i][j] = t
+
+        cache.save()
+        print(f"步行时间矩阵: {n} 个项目，{requested} 次 OSRM /table 请求")
         return matrix
 
 
-if __name__ == "__main__":
-    from dataclasses import asdict
-    import json
+def load_park(path: str):
+    """.json 文件读成 ThemePark，其余按 CompiledPark 的二进制格式 mmap 加载"""
+    if path.endswith(".json"):
+        return ThemePark.from_json(path)
+    return CompiledPark.load(path)
+
+
+def refresh_park_file(path: str, **kwargs):
+    """读取乐园 JSON 文件，增量更新（参数见 ThemePark.refresh）后写回原文件"""
+    park = ThemePark.from_json(path).refresh(**kwargs)
+    park.to_json(path)
+    return park
 
-    disney = ThemePark.from_scraper(
-        "Shanghai Disney Resort",
-        # ["Camp Discovery", "Soaring Over the Horizon"]
-    )
 
-    with open("../parks/ShanghaiDisney.json", "w", encoding="utf-8") as f:
-        json.dump(asdict(disney), f, ensure_ascii=False, indent=2)
+if __name__ == "__main__":
+    # 已有乐园文件时只做增量更新（默认只刷新历史排队时间），否则完整抓取
+    path = "../parks/ShanghaiDisney.json"
+    if os.path.exists(path):
+        refresh_park_file(path, walk_cache_path="../parks/walking_cache.json")
+    else:
+        disney = ThemePark.from_scraper(
+            "Shanghai Disney Resort",
+            # ["Camp Discovery", "Soaring Over the Horizon"]
+            walk_cache_path="../parks/walking_cache.json",
+        )
+        disney.to_json(path)
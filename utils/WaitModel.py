@@ -0,0 +1,166 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import date
+
+import numpy as np
+
+
+# 项目不开放时的排队时间：到达时已关闭的路线不可行
+CLOSED = np.inf
+# 没有对应日历的历史数据时使用的 profile，即 ThemePark.history_results（all time 平均）
+DEFAULT_PROFILE = "all"
+# 星期几的 profile 名称，按 date.weekday() 取，不随 locale 变化
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+
+class WaitPredictor(ABC):
+    """
+    排队时间预测器的接口：把一个项目的历史样本 [[hour, wait], ...]（hour 为一天中的小时，可以是小数）
+    编译成给定时刻 minutes（一天中的分钟数）的排队时间，以及样本覆盖的营业时段 window。
+    """
+
+    @abstractmethod
+    def predict(self, samples: list, minutes: np.ndarray) -> np.ndarray:
+        ...
+
+    @abstractmethod
+    def window(self, samples: list) -> tuple[float, float]:
+        # 有样本的时段 [开始, 结束)，单位为一天中的分钟数
+        ...
+
+
+class HourlyInterpolation(WaitPredictor):
+    """整点样本之间线性插值，每个样本代表从该整点起的一个小时"""
+
+    def predict(self, samples, minutes):
+        points = np.array(sorted(samples), dtype=np.float64).reshape(-1, 2)
+        return np.interp(minutes, points[:, 0] * 60, points[:, 1])
+
+    def window(self, samples):
+        hours = [hour for hour, _ in samples]
+        return min(hours) * 60, (max(hours) + 1) * 60
+
+
+class BucketProfile(WaitPredictor):
+    """更细的时段平均值（默认 15 分钟一个时段），时段内取常数；hour 为时段开始的时刻，例如 9.25"""
+
+    def __init__(self, minutes: int = 15):
+        self.minutes = minutes
+
+    def predict(self, samples, minutes):
+        points = np.array(sorted(samples), dtype=np.float64).reshape(-1, 2)
+        index = np.searchsorted(points[:, 0] * 60, minutes, side="right") - 1
+        return points[np.maximum(index, 0), 1]
+
+    def window(self, samples):
+        starts = [hour * 60 for hour, _ in samples]
+        return min(starts), max(starts) + self.minutes
+
+
+class LiveOverride(WaitPredictor):
+    """
+    实时排队时间层：在 base 的预测上叠加 at 时刻（一天中的分钟数）的观测值 wait 与预测值的差，
+    这个差从 at 起在 decay 分钟内线性衰减到 0，at 之前不变。
+    """
+
+    def __init__(self, base: WaitPredictor, wait: float, at: float, decay: float = 60):
+        self.base = base
+        self.wait = wait
+        self.at = at
+        self.decay = decay
+
+    def predict(self, samples, minutes):
+        return self.adjust(self.base.predict(samples, minutes), minutes)
+
+    def window(self, samples):
+        return self.base.window(samples)
+
+    def adjust(self, predicted: np.ndarray, minutes: np.ndarray) -> np.ndarray:
+        # 修正已经编译好的一行排队时间，predicted[k] 对应 minutes[k]；关闭的时刻不变
+        after = minutes >= self.at
+        if not after.any() or not np.isfinite(predicted[after][0]):
+            return predicted
+        weight = np.where(after, np.clip(1 - (minutes - self.at) / self.decay, 0.0, 1.0), 0.0)
+        adjusted = predicted + (self.wait - predicted[after][0]) * weight
+        return np.where(np.isfinite(predicted), np.maximum(adjusted, 0.0), predicted)
+
+
+@dataclass
+class Calendar:
+    """
+    把日期映射到按优先级排列的 profile 名称：节假日 "holiday"、星期几（"saturday" 等）、
+    "weekend" / "weekday"、所在季节（seasons 中的名称），最后是 "all"。
+    seasons 为 {名称: (开始月份, 结束月份)}，开始月份大于结束月份时跨年，例如 "winter": (12, 2)。
+    """
+    holidays: set[date] = field(default_factory=set)
+    seasons: dict[str, tuple[int, int]] = field(default_factory=dict)
+
+    def profiles(self, day: date) -> tuple[str, ...]:
+        names = []
+        if day in self.holidays:
+            names.append("holiday")
+        names.append(WEEKDAYS[day.weekday()])
+        names.append("weekend" if day.weekday() >= 5 else "weekday")
+        for season, (first, last) in self.seasons.items():
+            if first <= day.month <= last or (first > last and (day.month >= first or day.month <= last)):
+                names.append(season)
+        names.append(DEFAULT_PROFILE)
+        return tuple(names)
+
+
+class WaitModel:
+    """
+    按 (项目, 日历 profile) 组织的排队时间模型。历史样本来自 park.history_results（"all"）和
+    park.profile_history（{profile: {项目: [[hour, wait], ...]}}）；每个项目使用 calendar.profiles(day)
+    中第一个有样本的 profile，用 predictors 中为它指定的预测器（默认 predictor）编译。
+
+    compile(day) 返回 table[ride_id, minute]（minute 为距开园的分钟数，覆盖到当天 24:00，末尾附加一个
+    CLOSED 哨兵），同一组 profile 只编译一次。营业时段取乐园的 open_time / close_time 与样本时段的交集：
+    在项目开放前到达的要等到开放（排队时间包含这段等待），关闭后到达为 CLOSED。
+    """
+
+    def __init__(self, park, predictor: WaitPredictor = None, calendar: Calendar = None,
+                 predictors: dict[str, WaitPredictor] = None):
+        if not hasattr(park, "history_results"):
+            # CompiledPark 只保存了编译好的 all time 排队时间表，没有历史样本
+            raise ValueError("WaitModel needs a ThemePark with wait history, not a CompiledPark")
+        self.park = park
+        self.predictor = predictor or HourlyInterpolation()
+        self.calendar = calendar or Calendar()
+        self.predictors = predictors or {}
+        self._tables = {}
+
+    def samples(self, ride: str, profiles: tuple[str, ...]) -> list:
+        history = getattr(self.park, "profile_history", {})
+        for profile in profiles:
+            if profile == DEFAULT_PROFILE:
+                return self.park.history_results[ride]
+            if ride in history.get(profile, {}):
+                return history[profile][ride]
+        return self.park.history_results[ride]
+
+    def compile(self, day: date = None) -> np.ndarray:
+        profiles = self.calendar.profiles(day) if day is not None else (DEFAULT_PROFILE,)
+        if profiles not in self._tables:
+            self._tables[profiles] = self._compile(profiles)
+        return self._tables[profiles]
+
+    def _compile(self, profiles: tuple[str, ...]) -> np.ndarray:
+        open_minute = self.park.open_time * 60
+        minutes = np.arange(open_minute, 24 * 60, dtype=np.float64)
+        table = np.full((len(self.park.valid_rides), len(minutes) + 1), CLOSED)
+        for ride_id, ride in enumerate(self.park.valid_rides):
+            samples = self.samples(ride, profiles)
+            if not samples:
+                continue
+            predictor = self.predictors.get(ride, self.predictor)
+            start, end = predictor.window(samples)
+            start = max(start, open_minute)
+            end = min(end, self.park.close_time * 60)
+            if start >= end:
+                continue
+            wait = predictor.predict(samples, np.maximum(minutes, start))
+            # 开放前到达：等到开放再排队
+            wait = np.where(minutes < start, wait + (start - minutes), wait)
+            table[ride_id, :-1] = np.where(minutes < end, wait, CLOSED)
+        return table